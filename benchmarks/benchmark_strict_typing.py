@@ -0,0 +1,73 @@
+"""Measure the runtime type checking overhead that production mode saves.
+
+Runs the receive and read benchmarks in two subprocesses, one with and one
+without the WALYTIS_MUTABILITY_PRODUCTION environment variable set, and
+reports the per-call time of each.
+Only module-level functions are type checked, not methods, so the
+difference is mostly the checks on helpers like `bytes_to_string`.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+WORKDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(WORKDIR), "src"))
+
+N_BLOCKS = 2000
+N_READS = 100000
+
+
+def measure() -> dict:
+    """Time the receive and read paths in the current process."""
+    from benchmark_sync import generate_blocks
+    from walytis_mutability.memory_blockchain import MemoryBlockchain
+
+    from walytis_mutability import MutaBlockchain
+
+    blocks = generate_blocks(N_BLOCKS)
+    base_blockchain = MemoryBlockchain()
+    mutablockchain = MutaBlockchain(base_blockchain)
+
+    start = perf_counter()
+    for block in blocks:
+        base_blockchain.receive_block(block)
+    receive_time = (perf_counter() - start) / N_BLOCKS
+
+    mutablock = mutablockchain.get_block(mutablockchain.get_block_ids()[0])
+    start = perf_counter()
+    for _ in range(N_READS):
+        mutablock.content
+    read_time = (perf_counter() - start) / N_READS
+
+    mutablockchain.terminate()
+    return {"receive": receive_time, "read": read_time}
+
+
+def run_benchmark() -> None:
+    results = {}
+    for production_mode in ["false", "true"]:
+        env = dict(os.environ, WALYTIS_MUTABILITY_PRODUCTION=production_mode)
+        output = subprocess.run(
+            [sys.executable, __file__, "--measure"],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        results[production_mode] = json.loads(output.splitlines()[-1])
+    print(f"{'path':>8} {'strict (us)':>12} {'production (us)':>16} "
+          f"{'saved (us)':>11}")
+    for path in ["receive", "read"]:
+        strict = results["false"][path] * 1e6
+        production = results["true"][path] * 1e6
+        print(
+            f"{path:>8} {strict:>12.2f} {production:>16.2f} "
+            f"{strict - production:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    if "--measure" in sys.argv:
+        print(json.dumps(measure()))
+    else:
+        run_benchmark()
@@ -0,0 +1,72 @@
+"""Measure how the time to sync MutaBlocks scales with the number of blocks.
+
+Base blocks are created on an in-memory blockchain and then fed to a fresh
+MutaBlockchain one by one, like blocks received from peers during an
+initial sync. The time per block should stay roughly constant as the
+number of blocks grows.
+"""
+
+import os
+import sys
+from time import perf_counter
+
+WORKDIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(WORKDIR), "src"))
+
+if True:
+    from brenthy_tools_beta.utils import bytes_to_string
+    from walytis_mutability.memory_blockchain import (
+        MemoryBlock,
+        MemoryBlockchain,
+    )
+
+    from walytis_mutability import MutaBlockchain
+    from walytis_mutability.mutablock import ORIGINAL_BLOCK, UPDATE_BLOCK
+
+BLOCK_COUNTS = [1000, 2000, 4000, 8000]
+EDITS_PER_MUTABLOCK = 3
+
+
+def generate_blocks(n_blocks: int) -> list[MemoryBlock]:
+    """Create base blocks for MutaBlocks with a few edits each."""
+    generator = MemoryBlockchain()
+    blocks = []
+    while len(blocks) < n_blocks:
+        parent = generator.create_block(b"original", [ORIGINAL_BLOCK])
+        blocks.append(parent)
+        for i in range(EDITS_PER_MUTABLOCK):
+            if len(blocks) == n_blocks:
+                break
+            parent = generator.create_block(
+                f"edit {i}".encode(),
+                [UPDATE_BLOCK, bytes_to_string(parent.long_id)],
+            )
+            blocks.append(parent)
+    return blocks
+
+
+def benchmark_sync(n_blocks: int) -> float:
+    """Get the time in seconds a MutaBlockchain needs to process blocks."""
+    blocks = generate_blocks(n_blocks)
+    base_blockchain = MemoryBlockchain()
+    mutablockchain = MutaBlockchain(base_blockchain)
+    start = perf_counter()
+    for block in blocks:
+        base_blockchain.receive_block(block)
+    duration = perf_counter() - start
+    mutablockchain.terminate()
+    return duration
+
+
+def run_benchmark() -> None:
+    print(f"{'blocks':>8} {'total (s)':>10} {'per block (us)':>15}")
+    for n_blocks in BLOCK_COUNTS:
+        duration = benchmark_sync(n_blocks)
+        print(
+            f"{n_blocks:>8} {duration:>10.3f} "
+            f"{duration / n_blocks * 1e6:>15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmark()
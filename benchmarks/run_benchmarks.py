@@ -0,0 +1,274 @@
+"""Benchmark suite for MutaBlockchain on an in-memory base blockchain.
+
+Measures write throughput, read latency, initial-sync time, startup time and
+peak memory for different numbers of blocks, as well as the cost of
+operations on MutaBlocks with long histories.
+Results are written as JSON so that runs can be compared:
+
+    python run_benchmarks.py --output results.json
+    python run_benchmarks.py --compare old.json new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from statistics import median
+from time import perf_counter
+from typing import Callable
+
+WORKDIR = os.path.dirname(os.path.abspath(__file__))
+PROJ_DIR = os.path.dirname(WORKDIR)
+sys.path.insert(0, os.path.join(PROJ_DIR, "src"))
+
+if True:
+    from benchmark_sync import generate_blocks
+    from walytis_mutability.memory_blockchain import MemoryBlockchain
+
+    from walytis_mutability import MutaBlockchain
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_DEPTHS = [1, 10, 100, 1000, 10000]
+N_OPERATIONS = 1000  # how many operations to time in latency benchmarks
+
+# how much slower a metric may get before `--compare` reports it
+REGRESSION_THRESHOLD = 1.1
+
+
+def _timed(function: Callable[[], None]) -> float:
+    start = perf_counter()
+    function()
+    return perf_counter() - start
+
+
+def _latencies(function: Callable[[int], None], n: int) -> dict:
+    """Time a function n times, getting the median and 99th percentile."""
+    durations = []
+    for i in range(n):
+        start = perf_counter()
+        function(i)
+        durations.append(perf_counter() - start)
+    durations.sort()
+    return {
+        "median_us": median(durations) * 1e6,
+        "p99_us": durations[int(len(durations) * 0.99)] * 1e6,
+    }
+
+
+def _peak_memory(function: Callable[[], None]) -> int:
+    """Get the peak memory allocated while running a function, in bytes."""
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def _populate(n_blocks: int, appdata_dir: str = "") -> MemoryBlockchain:
+    """Create a base blockchain with n_blocks MutaBlock base blocks."""
+    base_blockchain = MemoryBlockchain()
+    for block in generate_blocks(n_blocks):
+        base_blockchain.receive_block(block)
+    if appdata_dir:
+        MutaBlockchain(base_blockchain, appdata_dir=appdata_dir).terminate()
+    return base_blockchain
+
+
+def benchmark_writes(n_blocks: int) -> dict:
+    """Measure add, edit and delete throughput in operations per second."""
+    n_operations = min(n_blocks, N_OPERATIONS)
+    mutablockchain = MutaBlockchain(_populate(n_blocks - n_operations))
+    blocks = []
+    add_time = _timed(lambda: blocks.extend(
+        mutablockchain.add_block(b"content") for _ in range(n_operations)
+    ))
+    edit_time = _timed(lambda: [block.edit(b"edited") for block in blocks])
+    delete_time = _timed(lambda: [block.delete() for block in blocks])
+    batch_time = _timed(lambda: mutablockchain.add_blocks(
+        [b"content"] * n_operations
+    ))
+    mutablockchain.terminate()
+    return {
+        "add_per_s": n_operations / add_time,
+        "edit_per_s": n_operations / edit_time,
+        "delete_per_s": n_operations / delete_time,
+        "batch_add_per_s": n_operations / batch_time,
+    }
+
+
+def benchmark_reads(n_blocks: int) -> dict:
+    """Measure the latency of reading MutaBlock content."""
+    mutablockchain = MutaBlockchain(_populate(n_blocks))
+    block_ids = mutablockchain.get_block_ids()
+    step = max(1, len(block_ids) // N_OPERATIONS)
+    sample = block_ids[::step][:N_OPERATIONS]
+
+    def read(i: int) -> None:
+        mutablockchain.get_block(sample[i % len(sample)]).content
+
+    cold = _latencies(read, len(sample))
+    warm = _latencies(read, N_OPERATIONS)
+    mutablockchain.terminate()
+    return {"cold_read": cold, "warm_read": warm}
+
+
+def benchmark_sync(n_blocks: int) -> dict:
+    """Measure the time and memory needed to process received blocks."""
+    blocks = generate_blocks(n_blocks)
+
+    def sync() -> None:
+        base_blockchain = MemoryBlockchain()
+        mutablockchain = MutaBlockchain(base_blockchain)
+        for block in blocks:
+            base_blockchain.receive_block(block)
+        mutablockchain.terminate()
+
+    duration = _timed(sync)
+    return {
+        "sync_s": duration,
+        "sync_per_block_us": duration / n_blocks * 1e6,
+        "sync_peak_memory_bytes": _peak_memory(sync),
+    }
+
+
+def benchmark_startup(n_blocks: int) -> dict:
+    """Measure the time to load a MutaBlockchain on an existing chain."""
+    appdata_dir = tempfile.mkdtemp()
+    try:
+        base_blockchain = _populate(n_blocks, appdata_dir)
+        results = {}
+        results["startup_checkpoint_s"] = _timed(
+            lambda: MutaBlockchain(
+                base_blockchain, appdata_dir=appdata_dir
+            ).terminate()
+        )
+        results["startup_cold_s"] = _timed(
+            lambda: MutaBlockchain(
+                base_blockchain, appdata_dir=appdata_dir, forget_appdata=True
+            ).terminate()
+        )
+    finally:
+        shutil.rmtree(appdata_dir)
+    return results
+
+
+def benchmark_history(depth: int) -> dict:
+    """Measure operations on a MutaBlock with a history of `depth` edits."""
+    mutablockchain = MutaBlockchain(MemoryBlockchain())
+    block = mutablockchain.add_block(b"version 0")
+    for i in range(depth):
+        block.edit(f"version {i + 1}".encode())
+    n_operations = min(N_OPERATIONS, 100)
+    results = {
+        "content": _latencies(lambda i: block.content, n_operations),
+        "edit": _latencies(lambda i: block.edit(b"edited"), n_operations),
+        "get_content_versions": _latencies(
+            lambda i: block.get_content_versions(), 10
+        ),
+    }
+    mutablockchain.terminate()
+    return results
+
+
+def run_benchmarks(sizes: list[int], depths: list[int]) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PROJ_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+    results = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "production_mode": os.environ.get("WALYTIS_MUTABILITY_PRODUCTION", ""),
+        "sizes": {},
+        "depths": {},
+    }
+    for n_blocks in sizes:
+        print(f"Benchmarking {n_blocks} blocks...", file=sys.stderr)
+        results["sizes"][str(n_blocks)] = {
+            "writes": benchmark_writes(n_blocks),
+            "reads": benchmark_reads(n_blocks),
+            "sync": benchmark_sync(n_blocks),
+            "startup": benchmark_startup(n_blocks),
+        }
+    for depth in depths:
+        print(f"Benchmarking history depth {depth}...", file=sys.stderr)
+        results["depths"][str(depth)] = benchmark_history(depth)
+    return results
+
+
+def _flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str) -> bool:
+    """Print the metrics that got worse between two runs.
+
+    Returns:
+        bool: whether or not any regressions were found
+    """
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    old = _flatten({"sizes": old["sizes"], "depths": old["depths"]})
+    new = _flatten({"sizes": new["sizes"], "depths": new["depths"]})
+    regressed = False
+    for key in sorted(old.keys() & new.keys()):
+        # throughputs should grow, everything else should shrink
+        ratio = (
+            old[key] / new[key] if key.endswith("_per_s")
+            else new[key] / old[key]
+        ) if old[key] and new[key] else 1
+        if ratio > REGRESSION_THRESHOLD:
+            regressed = True
+            print(f"{key}: {old[key]:.6g} -> {new[key]:.6g} ({ratio:.2f}x worse)")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+        help="numbers of blocks to benchmark with",
+    )
+    parser.add_argument(
+        "--depths", type=int, nargs="+", default=DEFAULT_DEPTHS,
+        help="MutaBlock history depths to benchmark with",
+    )
+    parser.add_argument(
+        "--output", default="", help="path of the JSON file to write"
+    )
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"),
+        help="compare two result files instead of running benchmarks",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+    results = run_benchmarks(args.sizes, args.depths)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
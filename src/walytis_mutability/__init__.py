@@ -1,3 +1,7 @@
 import walytis_beta_embedded # configure walytis_beta_api & walytis_beta_tools via environment variable
 from .mutablockchain import MutaBlockchain
 from .mutablock import MutaBlock, ContentVersion
+from .async_mutablockchain import AsyncMutaBlockchain
+from .caching_blockchain import CachingBlockchain
+from .compression import register_codec
+from .notifications import CoalescedBlock, ReceivedBlock
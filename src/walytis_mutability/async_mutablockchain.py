@@ -0,0 +1,178 @@
+"""An asyncio front-end for MutaBlockchain."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+from typing import AsyncIterator, Callable, TypeVar
+
+from walytis_beta_api._experimental.generic_blockchain import GenericBlock
+
+from .mutablock import ContentVersion, MutaBlock
+from .mutablockchain import MutaBlockchain
+from .utils import apply_strict_typing
+
+ReturnType = TypeVar("ReturnType")
+
+
+class AsyncMutaBlockchain:
+    """Coroutine wrappers around a MutaBlockchain's blocking operations.
+
+    Operations that may block on the base blockchain run on a bounded thread
+    pool, so that many reads and writes can overlap without blocking the
+    event loop.
+    """
+
+    def __init__(
+        self, mutablockchain: MutaBlockchain, max_workers: int = 8
+    ):
+        """Wrap a MutaBlockchain.
+
+        Args:
+            mutablockchain: the MutaBlockchain to wrap
+            max_workers: how many operations may run concurrently
+        """
+        self.mutablockchain = mutablockchain
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="AsyncMutaBlockchain",
+        )
+        # queues of the running `received_blocks` iterators
+        self._subscribers: list[
+            tuple[asyncio.AbstractEventLoop, asyncio.Queue]
+        ] = []
+        self._subscribers_lock = Lock()
+
+        # receive blocks while still calling any existing handler
+        self._block_received_handler = mutablockchain.block_received_handler
+        mutablockchain.block_received_handler = self._on_block_received
+
+    async def _run(
+        self, function: Callable[..., ReturnType], *args, **kwargs
+    ) -> ReturnType:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(function, *args, **kwargs)
+        )
+
+    async def add_block(
+        self,
+        content: bytes | bytearray,
+        topics: list[str] | str = "",
+        codec: str | None = None,
+    ) -> MutaBlock:
+        return await self._run(
+            self.mutablockchain.add_block, content, topics, codec
+        )
+
+    async def edit_block(
+        self,
+        parent_id: bytes | bytearray,
+        content: bytes | bytearray,
+        topics: list[str] | str | None = None,
+        codec: str | None = None,
+    ) -> None:
+        await self._run(
+            self.mutablockchain.edit_block, parent_id, content, topics, codec
+        )
+
+    async def find_blocks(
+        self,
+        topic: str | None = None,
+        creator_id: bytearray | bytes | None = None,
+    ) -> list[MutaBlock]:
+        return await self._run(
+            self.mutablockchain.find_blocks, topic, creator_id
+        )
+
+    async def delete_block(self, parent_id: bytes | bytearray) -> None:
+        await self._run(self.mutablockchain.delete_block, parent_id)
+
+    async def add_blocks(
+        self,
+        blocks: list[
+            bytes | bytearray | tuple[bytes | bytearray, list[str] | str]
+        ],
+    ) -> list[MutaBlock]:
+        return await self._run(self.mutablockchain.add_blocks, blocks)
+
+    async def edit_blocks(self, edits: dict[bytes, bytes | bytearray]) -> None:
+        await self._run(self.mutablockchain.edit_blocks, edits)
+
+    async def delete_blocks(self, parent_ids: list[bytes | bytearray]) -> None:
+        await self._run(self.mutablockchain.delete_blocks, parent_ids)
+
+    async def get_block(self, block_id: bytes | bytearray | int) -> MutaBlock:
+        return await self._run(self.mutablockchain.get_block, block_id)
+
+    async def get_content(
+        self, block_id: bytes | bytearray
+    ) -> bytes | bytearray:
+        """Get the current content of a MutaBlock."""
+        return await self._run(
+            lambda: self.mutablockchain.get_block(block_id).content
+        )
+
+    async def get_current_content_version(
+        self, block_id: bytes | bytearray
+    ) -> ContentVersion:
+        return await self._run(
+            self.mutablockchain.get_mutablock_head, block_id
+        )
+
+    async def get_content_versions(
+        self, block_id: bytes | bytearray
+    ) -> list[ContentVersion]:
+        return await self._run(
+            self.mutablockchain.get_mutablock_content_versions, block_id
+        )
+
+    def get_block_ids(self) -> list[bytes]:
+        return self.mutablockchain.get_block_ids()
+
+    def get_num_blocks(self) -> int:
+        return self.mutablockchain.get_num_blocks()
+
+    async def received_blocks(self) -> AsyncIterator[GenericBlock]:
+        """Iterate over the blocks received from now on.
+
+        Usage:
+            async for block in async_mutablockchain.received_blocks():
+                ...
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._subscribers_lock:
+            self._subscribers.append(subscriber)
+        try:
+            while True:
+                yield await subscriber[1].get()
+        finally:
+            with self._subscribers_lock:
+                self._subscribers.remove(subscriber)
+
+    def _on_block_received(self, block: GenericBlock) -> None:
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, block)
+            except RuntimeError:  # event loop already closed
+                pass
+        if self._block_received_handler:
+            self._block_received_handler(block)
+
+    async def aclose(self) -> None:
+        """Stop using the MutaBlockchain, without terminating it."""
+        mutablockchain = self.mutablockchain
+        if mutablockchain.block_received_handler == self._on_block_received:
+            mutablockchain.block_received_handler = (
+                self._block_received_handler
+            )
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> "AsyncMutaBlockchain":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+
+apply_strict_typing(__name__)
@@ -1,93 +1,578 @@
 """The machinery for MutaBlock storage in an SQLite database."""
-from decorate_all import decorate_all_functions
-from strict_typing import strictly_typed
 import json
 import os
 import sqlite3
 from abc import ABC, abstractmethod
-from brenthy_tools_beta.utils import string_to_time, time_to_string, bytes_to_string
-from walytis_beta_api import Block, decode_short_id
-from .mutablock import ORIGINAL_BLOCK, ContentVersion, BLOCK_TYPES
-from .utils import logger
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from functools import partial
+from threading import RLock
+from brenthy_tools_beta.utils import (
+    string_to_time, time_to_string, string_to_bytes
+)
+from walytis_beta_api import Block
+from .cache import LRUCache
+from .chunking import CHUNKED_TOPIC, ContentReader, decode_manifest
+from .compression import decompress
+from .delta import apply_delta
+from .mutablock import (
+    DELETION_BLOCK, DELTA_BLOCK, ORIGINAL_BLOCK, ContentVersion, BLOCK_TYPES
+)
+from .utils import apply_strict_typing, logger
 TIME_FORMAT = '%Y.%m.%d_%H.%M.%S.%f'
 
+# increment whenever the database layout changes,
+# outdated databases are dropped and rebuilt from the base blockchain
+SCHEMA_VERSION = 3
+
 
 class BlockStore(ABC):
     """MutaBlock storage management in an SQLite database."""
 
     db_path = "content_versions.db"
+    db: sqlite3.Connection | None = None
 
     @abstractmethod
     def decode_base_block(self, block: Block) -> ContentVersion:
         pass
 
-    def init_blockstore(self) -> None:
-        """Initialise."""
-        pass
+    def init_blockstore(
+        self,
+        appdata_dir: str = "",
+        forget_appdata: bool = False,
+        cache_max_entries: int = 1024,
+        cache_max_bytes: int = 64 * 1024 * 1024,
+    ) -> None:
+        """Initialise.
+
+        Args:
+            appdata_dir: the directory in which to store the database,
+                if empty the database is kept in memory only
+            forget_appdata: whether or not to delete any existing database
+            cache_max_entries: how many decoded ContentVersions to cache,
+                not counting MutaBlocks' heads, which are always kept
+            cache_max_bytes: the maximum total content size of the cached
+                ContentVersions, applied separately to the loaded content
+                of MutaBlocks' heads
+        """
+        self._db_lock = RLock()
+        self._content_version_cache: LRUCache[bytes, ContentVersion] = (
+            LRUCache(
+                max_entries=cache_max_entries,
+                max_bytes=cache_max_bytes,
+                get_size=lambda content_version: content_version.loaded_size,
+            )
+        )
+        # MutaBlock ID: its head ContentVersion, added when a head is
+        # received or first accessed
+        self._mutablock_heads: dict[bytes, ContentVersion] = {}
+        # the heads with loaded content, whose content is released when
+        # they exceed the size limit
+        self._head_content_cache: LRUCache[bytes, ContentVersion] = LRUCache(
+            max_entries=0,
+            max_bytes=cache_max_bytes,
+            get_size=lambda content_version: content_version.loaded_size,
+            on_evict=lambda _, content_version: (
+                content_version.release_content()
+            ),
+        )
+        if appdata_dir:
+            if not os.path.exists(appdata_dir):
+                os.makedirs(appdata_dir)
+            db_path = os.path.join(appdata_dir, self.db_path)
+            if forget_appdata:
+                for path in [db_path, db_path + "-wal", db_path + "-shm"]:
+                    if os.path.exists(path):
+                        os.remove(path)
+        else:
+            db_path = ":memory:"
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+
+        schema_version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if schema_version != SCHEMA_VERSION:
+            if schema_version != 0:
+                logger.info(
+                    "BlockStore: outdated database schema, rebuilding..."
+                )
+            self.db.execute("DROP TABLE IF EXISTS content_versions")
+            self.db.execute("DROP TABLE IF EXISTS metadata")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS content_versions (
+                cv_id BLOB PRIMARY KEY,
+                type TEXT NOT NULL,
+                parent_id BLOB NOT NULL,
+                original_id BLOB NOT NULL,
+                timestamp TEXT NOT NULL,
+                topics TEXT NOT NULL,
+                creator_id BLOB NOT NULL
+            )
+            """
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS metadata "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_original_id "
+            "ON content_versions (original_id, timestamp)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_parent_id "
+            "ON content_versions (parent_id)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_type ON content_versions (type)"
+        )
+        self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.commit()
 
-    def add_content_version(self, content_version: ContentVersion) -> None:
+        # IDs of all the ContentVersions we've stored
+        self._content_version_ids: set[bytes] = set()
+        # ContentVersion ID: original ID, for versions with verified ancestry
+        self._verified_original_ids: dict[bytes, bytes] = {}
+        # MutaBlock ID: time-ordered list of (timestamp, ContentVersion ID)
+        self._mutablock_versions: dict[
+            bytes, list[tuple[datetime, bytes]]
+        ] = {}
+        # MutaBlock ID: timestamp and user topics of its latest version
+        # that specifies topics
+        self._mutablock_topics: dict[bytes, tuple[datetime, list[str]]] = {}
+        # inverted indexes of MutaBlock IDs, dicts used as ordered sets
+        self._topic_index: dict[str, dict[bytes, None]] = {}
+        self._creator_index: dict[bytes, dict[bytes, None]] = {}
+        # (timestamp, ContentVersion ID) of all ContentVersions, time-ordered
+        self._versions_by_time: list[tuple[datetime, bytes]] = []
+        # IDs of the MutaBlocks whose latest version is a deletion
+        self._deleted_mutablock_ids: set[bytes] = set()
+        # IDs of the stored MutaBlocks whose latest version isn't a deletion,
+        # a dict used as an ordered set
+        self._live_mutablock_ids: dict[bytes, None] = {}
+        for original_id, timestamp, cv_id, type, topics, creator_id in (
+            self.db.execute(
+                "SELECT original_id, timestamp, cv_id, type, topics, "
+                "creator_id FROM content_versions "
+                "ORDER BY original_id, timestamp, cv_id"
+            )
+        ):
+            timestamp = string_to_time(timestamp)
+            self._content_version_ids.add(cv_id)
+            self._verified_original_ids[cv_id] = original_id
+            self._mutablock_versions.setdefault(original_id, []).append(
+                (timestamp, cv_id)
+            )
+            self._versions_by_time.append((timestamp, cv_id))
+            # rows are time-ordered, so each is its MutaBlock's head so far
+            self._update_deletion_state(original_id, type)
+            self._index_mutablock_metadata(
+                original_id, type, timestamp, json.loads(topics), creator_id
+            )
+        self._versions_by_time.sort()
+        # in order of creation, like `get_mutablock_ids`
+        self._live_mutablock_ids = dict.fromkeys(
+            mutablock_id for mutablock_id in self.get_mutablock_ids()
+            if mutablock_id not in self._deleted_mutablock_ids
+        )
+
+    def add_content_version(
+        self, content_version: ContentVersion, commit: bool = True
+    ) -> None:
         """Store ContentVersions in the database."""
-        pass
+        with self._db_lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO content_versions "
+                "(cv_id, type, parent_id, original_id, timestamp, topics, "
+                "creator_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    bytes(content_version.cv_id),
+                    content_version.type,
+                    bytes(content_version.parent_id),
+                    bytes(content_version.original_id),
+                    time_to_string(content_version.timestamp),
+                    json.dumps(content_version.topics),
+                    bytes(content_version.creator_id),
+                )
+            )
+            if commit:
+                self.db.commit()
+            # the database may be shared with other instances that already
+            # stored it, so whether it's indexed depends only on our index
+            if not self.is_content_version_known(content_version.cv_id):
+                self._index_content_version(content_version)
+
+    def get_stored_content_versions(
+        self,
+    ) -> list[tuple[bytes, str, bytes, bytes, datetime, list[str], bytes]]:
+        """Get the metadata of all stored ContentVersions.
+
+        Returns:
+            list: tuples of ContentVersion ID, type, parent ID, original ID,
+                timestamp, topics and creator ID, in the order they were
+                stored
+        """
+        with self._db_lock:
+            rows = self.db.execute(
+                "SELECT cv_id, type, parent_id, original_id, timestamp, "
+                "topics, creator_id FROM content_versions ORDER BY rowid"
+            ).fetchall()
+        return [
+            (
+                cv_id, type, parent_id, original_id,
+                string_to_time(timestamp), json.loads(topics), creator_id
+            )
+            for (
+                cv_id, type, parent_id, original_id, timestamp, topics,
+                creator_id
+            ) in rows
+        ]
+
+    def get_checkpoint(self) -> tuple[int, bytes]:
+        """Get the number and last ID of the base blocks already processed."""
+        with self._db_lock:
+            rows = dict(self.db.execute(
+                "SELECT key, value FROM metadata "
+                "WHERE key IN ('n_processed_blocks', 'last_processed_block')"
+            ).fetchall())
+        return (
+            int(rows.get("n_processed_blocks", 0)),
+            bytes(rows.get("last_processed_block", b"")),
+        )
+
+    def save_checkpoint(
+        self, n_processed_blocks: int, last_processed_block: bytes | bytearray
+    ) -> None:
+        """Record that the given number of base blocks have been processed.
+
+        Args:
+            n_processed_blocks: the number of base blocks, in the order of
+                the base blockchain's `get_block_ids()`, that have been
+                processed
+            last_processed_block: the ID of the last of those blocks
+        """
+        with self._db_lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+                [
+                    ("n_processed_blocks", n_processed_blocks),
+                    ("last_processed_block", bytes(last_processed_block)),
+                ]
+            )
+            self.db.commit()
+
+    def commit_content_versions(self) -> None:
+        """Commit ContentVersions added with `commit=False` to the database."""
+        with self._db_lock:
+            self.db.commit()
+
+    def _index_content_version(self, content_version: ContentVersion) -> None:
+        """Insert a ContentVersion into its MutaBlock's version list."""
+        self._content_version_ids.add(bytes(content_version.cv_id))
+        versions = self._mutablock_versions.setdefault(
+            bytes(content_version.original_id), []
+        )
+        entry = (content_version.timestamp, bytes(content_version.cv_id))
+        insort(versions, entry)
+        if versions[-1] == entry:  # the MutaBlock's new head
+            self._update_deletion_state(
+                bytes(content_version.original_id), content_version.type
+            )
+            self._set_mutablock_head(content_version)
+        elif content_version.type == ORIGINAL_BLOCK and (
+            bytes(content_version.original_id)
+            not in self._deleted_mutablock_ids
+        ):
+            # stored after some of its updates, list it now
+            self._live_mutablock_ids[bytes(content_version.original_id)] = None
+        # versions mostly arrive in order, so this rarely moves many entries
+        insort(self._versions_by_time, entry)
+        self._index_mutablock_metadata(
+            bytes(content_version.original_id),
+            content_version.type,
+            content_version.timestamp,
+            content_version.topics,
+            bytes(content_version.creator_id),
+        )
+
+    def _index_mutablock_metadata(
+        self,
+        mutablock_id: bytes,
+        type: str,
+        timestamp: datetime,
+        topics: list[str],
+        creator_id: bytes,
+    ) -> None:
+        """Update the topic and creator indexes with a ContentVersion.
+
+        A MutaBlock's topics are those of its latest version that specifies
+        any, so versions without topics inherit them from their ancestors.
+        Its creator is the creator of its original block.
+        """
+        if type == ORIGINAL_BLOCK and creator_id:
+            self._creator_index.setdefault(creator_id, {})[mutablock_id] = None
+        if not topics and type != ORIGINAL_BLOCK:
+            return
+        current = self._mutablock_topics.get(mutablock_id)
+        if current is not None:
+            if current[0] > timestamp:
+                return  # received out of order, a newer version has topics
+            for topic in current[1]:
+                index = self._topic_index.get(topic, {})
+                index.pop(mutablock_id, None)
+                if not index:
+                    self._topic_index.pop(topic, None)
+        self._mutablock_topics[mutablock_id] = (timestamp, topics)
+        for topic in topics:
+            self._topic_index.setdefault(topic, {})[mutablock_id] = None
+
+    def _update_deletion_state(
+        self, mutablock_id: bytes, head_type: str
+    ) -> None:
+        if head_type == DELETION_BLOCK:
+            self._deleted_mutablock_ids.add(mutablock_id)
+            self._live_mutablock_ids.pop(mutablock_id, None)
+        else:
+            self._deleted_mutablock_ids.discard(mutablock_id)
+            # a MutaBlock is only listed once its original is stored
+            if mutablock_id in self._content_version_ids:
+                self._live_mutablock_ids[mutablock_id] = None
+
+    def _set_mutablock_head(self, content_version: ContentVersion) -> None:
+        """Record a ContentVersion as its MutaBlock's head."""
+        cv_id = bytes(content_version.cv_id)
+        old_head = self._mutablock_heads.get(
+            bytes(content_version.original_id)
+        )
+        self._mutablock_heads[bytes(content_version.original_id)] = (
+            content_version
+        )
+        self._content_version_cache.remove(cv_id)
+        if content_version.is_content_loaded:
+            self._head_content_cache.put(cv_id, content_version)
+        if old_head is not None and bytes(old_head.cv_id) != cv_id:
+            # now an older version, cached like the others
+            self._head_content_cache.remove(bytes(old_head.cv_id))
+            self._content_version_cache.put(bytes(old_head.cv_id), old_head)
+
+    def is_mutablock_deleted(self, mutablock_id: bytearray | bytes) -> bool:
+        """Check if a MutaBlock's latest version is a deletion."""
+        return bytes(mutablock_id) in self._deleted_mutablock_ids
+
+    def get_mutablock_topics(
+        self, mutablock_id: bytearray | bytes
+    ) -> list[str]:
+        """Get the user topics of a MutaBlock's latest version."""
+        return list(
+            self._mutablock_topics.get(bytes(mutablock_id), (0, []))[1]
+        )
+
+    def find_mutablock_ids(
+        self,
+        topic: str | None = None,
+        creator_id: bytearray | bytes | None = None,
+    ) -> list[bytes]:
+        """Get the IDs of the MutaBlocks with the given topic and creator.
+
+        Args:
+            topic: a user topic the MutaBlocks' latest versions must have
+            creator_id: the ID of the creator of the MutaBlocks
+        Returns:
+            list[bytes]: the matching MutaBlock IDs
+        """
+        candidates = []
+        with self._db_lock:  # the indexes are updated while holding it
+            if topic is not None:
+                candidates.append(self._topic_index.get(topic, {}))
+            if creator_id is not None:
+                candidates.append(
+                    self._creator_index.get(bytes(creator_id), {})
+                )
+            if not candidates:
+                return list(self._mutablock_versions.keys())
+            smallest = min(candidates, key=len)
+            return [
+                mutablock_id for mutablock_id in smallest
+                if all(mutablock_id in index for index in candidates)
+            ]
+
+    def is_content_version_known(
+        self, content_version_id: bytearray | bytes
+    ) -> bool:
+        """Check if we've already stored the given ContentVersion."""
+        return bytes(content_version_id) in self._content_version_ids
 
     # Retrieve a ContentVersion from the database by id
 
     def get_content_version(
-        self, content_version_id: bytes | bytearray
+        self, content_version_id: bytearray | bytes
     ) -> ContentVersion | None:
         """Get a ContentVersion given its ID."""
-        return self.decode_base_block(
-            self.base_blockchain.get_block(content_version_id)
+        content_version_id = bytes(content_version_id)
+        head = self._mutablock_heads.get(
+            self._verified_original_ids.get(content_version_id, b"")
         )
+        if head is not None and bytes(head.cv_id) == content_version_id:
+            return head
+        content_version = self._content_version_cache.get(content_version_id)
+        if content_version is None:
+            content_version = self.decode_base_block(
+                self.base_blockchain.get_block(content_version_id)
+            )
+            self._content_version_cache.put(
+                content_version_id, content_version
+            )
+        return content_version
+
+    def _on_loaded_size_changed(self, content_version: ContentVersion) -> None:
+        """Account for content a cached ContentVersion loaded or released."""
+        cv_id = bytes(content_version.cv_id)
+        head = self._mutablock_heads.get(bytes(content_version.original_id))
+        if head is not content_version:
+            self._content_version_cache.refresh_size(cv_id)
+        elif content_version.is_content_loaded:
+            self._head_content_cache.put(cv_id, content_version)
+        else:
+            self._head_content_cache.remove(cv_id)
+
+    def load_content(self, content_version_id: bytearray | bytes) -> bytes:
+        """Load the content of a ContentVersion from the base blockchain.
+
+        Compressed content is decompressed, content stored in chunks is
+        joined, and delta updates are applied to their parent's content,
+        which is loaded the same way.
+        """
+        block = self.base_blockchain.get_block(content_version_id)
+        content = decompress(block.content, block.topics)
+        if CHUNKED_TOPIC in block.topics:
+            return b"".join(
+                self._open_chunks(decode_manifest(content)).iter_chunks()
+            )
+        if block.topics and block.topics[0] == DELTA_BLOCK:
+            parent = self.get_content_version(string_to_bytes(block.topics[1]))
+            return apply_delta(parent.content, content)
+        return content
+
+    def open_content(
+        self, content_version_id: bytearray | bytes
+    ) -> ContentReader:
+        """Open a ContentVersion's content for streaming.
+
+        Content stored in chunks is loaded one chunk at a time as it is
+        read, other content is loaded as a whole.
+        """
+        block = self.base_blockchain.get_block(content_version_id)
+        if CHUNKED_TOPIC in block.topics:
+            return self._open_chunks(
+                decode_manifest(decompress(block.content, block.topics))
+            )
+        content = self.get_content_version(content_version_id).content
+        return ContentReader([(len(content), lambda: content)])
+
+    def _open_chunks(self, chunks: list[tuple[int, bytes]]) -> ContentReader:
+        def load_chunk(block_id: bytes) -> bytes | bytearray:
+            block = self.base_blockchain.get_block(block_id)
+            return decompress(block.content, block.topics)
+        return ContentReader([
+            (size, partial(load_chunk, block_id)) for size, block_id in chunks
+        ])
+
+    def get_cache_stats(self) -> dict:
+        """Get the usage statistics of the ContentVersion caches.
+
+        Returns:
+            dict: the number of cached `entries`, their size in `bytes`,
+                and the number of cache `hits`, `misses` and `evictions`,
+                including the heads whose content is loaded
+        """
+        head_stats = self._head_content_cache.get_stats()
+        return {
+            key: value + head_stats[key]
+            for key, value in self._content_version_cache.get_stats().items()
+        }
 
     def get_mutablock_content_version_ids(
         self, mutablock_id: bytearray | bytes
-    ) -> list[bytearray]:
+    ) -> list[bytes]:
         """Get the content versions of the specified MutaBlock."""
-        content_version_ids = [mutablock_id]
-        mutablock_id_str = bytes_to_string(mutablock_id)
-        for block_id in self.base_blockchain._blocks:
-            block = self.base_blockchain._blocks[block_id]
-            topics = block.topics
-            if (
-                len(topics) >= 2
-                and topics[0] in BLOCK_TYPES and topics[1] == mutablock_id_str
-            ):
-                content_version_ids.append(block.long_id)
-        content_version_ids.sort(
-            key=lambda block_id: decode_short_id(block_id)["creation_time"]
-        )
-        return content_version_ids
+        return [
+            cv_id
+            for _, cv_id in self._mutablock_versions.get(
+                bytes(mutablock_id), []
+            )
+        ]
+
+    def get_content_version_ids_between(
+        self,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        mutablock_id: bytearray | bytes | None = None,
+    ) -> list[bytes]:
+        """Get the IDs of the ContentVersions created in a time range.
+
+        Args:
+            start: the earliest timestamp to include, unbounded if None
+            end: the timestamp before which to stop, unbounded if None
+            mutablock_id: only include versions of this MutaBlock
+        Returns:
+            list[bytes]: the ContentVersion IDs, ordered by timestamp
+        """
+        with self._db_lock:
+            if mutablock_id is None:
+                versions = self._versions_by_time
+            else:
+                versions = self._mutablock_versions.get(
+                    bytes(mutablock_id), []
+                )
+            # (timestamp,) sorts before any (timestamp, cv_id)
+            first = 0 if start is None else bisect_left(versions, (start,))
+            last = (
+                len(versions) if end is None
+                else bisect_left(versions, (end,))
+            )
+            return [cv_id for _, cv_id in versions[first:last]]
+
+    def get_mutablock_version_id_at(
+        self, mutablock_id: bytearray | bytes, time: datetime
+    ) -> bytes | None:
+        """Get the ID of a MutaBlock's ContentVersion current at a given time.
+
+        Returns:
+            bytes | None: the ID of the MutaBlock's latest ContentVersion
+                created no later than `time`, None if it had none yet
+        """
+        with self._db_lock:
+            versions = self._mutablock_versions.get(bytes(mutablock_id), [])
+            index = bisect_right(
+                versions, time, key=lambda version: version[0]
+            )
+            return versions[index - 1][1] if index else None
 
     def get_mutablock_content_versions(
         self, mutablock_id: bytearray | bytes
     ) -> list[ContentVersion]:
         return [
-            self.decode_base_block(
-                self.base_blockchain.get_block(block_id)
-            )
+            self.get_content_version(block_id)
             for block_id in self.get_mutablock_content_version_ids(mutablock_id)
         ]
 
-    def get_mutablock_ids(self, ) -> list[str]:
-        """Get the IDs of all MutaBlocks."""
-        mutablock_ids = []
-        for block_id in self.base_blockchain._blocks:
-            block = self.base_blockchain._blocks[block_id]
-            topics = block.topics
-            if len(topics) >= 1 and topics[0] == ORIGINAL_BLOCK:
-                mutablock_ids.append(block.long_id)
-        return mutablock_ids
-
-    def get_content_block_ids(self, ) -> list[str]:
+    def get_mutablock_ids(self, ) -> list[bytes]:
         """Get the IDs of all MutaBlocks."""
+        with self._db_lock:
+            rows = self.db.execute(
+                "SELECT cv_id FROM content_versions WHERE type = ? "
+                "ORDER BY rowid",
+                (ORIGINAL_BLOCK,)
+            ).fetchall()
+        return [row[0] for row in rows]
 
-        content_version_ids = []
-        for block_id in self.base_blockchain._blocks:
-            block = self.base_blockchain._blocks[block_id]
-            topics = block.topics
-            if len(topics) >= 1 and topics[0] in BLOCK_TYPES:
-                content_version_ids.append(block.long_id)
-        return content_version_ids
+    def get_content_block_ids(self, ) -> list[bytes]:
+        """Get the IDs of all ContentVersions of all MutaBlocks."""
+        with self._db_lock:
+            rows = self.db.execute(
+                "SELECT cv_id FROM content_versions ORDER BY rowid"
+            ).fetchall()
+        return [row[0] for row in rows]
     # Delete a mutablock.MutaBlock.ContentVersion from the database based on its id
 
     def verify_original(self, contentv_id: bytearray | bytes) -> ContentVersion:
@@ -97,18 +582,43 @@ class BlockStore(ABC):
         are consistent. Raises an exception if not,
         returns the original content_version object if yes.
         """
-        # logger.debug(f"Verifying original:\n{contentv_id}")
-        parent_version = self.get_content_version(contentv_id)
-        expected_original_id = parent_version.original_id
-        while parent_version.type != ORIGINAL_BLOCK:
-            parent_version = self.get_content_version(parent_version.parent_id)
-            if parent_version.original_id != expected_original_id:
+        return self.get_content_version(
+            self.get_verified_original_id(contentv_id)
+        )
+
+    def get_verified_original_id(
+        self, contentv_id: bytearray | bytes
+    ) -> bytes:
+        """Get the original ID of a ContentVersion, verifying its ancestry.
+
+        Walks up the chain of parents only until it reaches a ContentVersion
+        whose ancestry has already been verified, caching the result for all
+        ContentVersions on the way.
+        Raises CorruptContentAncestryError if the chain of parents doesn't
+        lead to an original MutaBlock.
+        """
+        unverified_ids = []
+        block_id = bytes(contentv_id)
+        while block_id not in self._verified_original_ids:
+            # only the block IDs' topics are needed, not their content
+            topics = self.base_blockchain.get_block(block_id).topics
+            if len(topics) >= 1 and topics[0] == ORIGINAL_BLOCK:
+                self._verified_original_ids[block_id] = block_id
+                break
+            if len(topics) < 2 or topics[0] not in BLOCK_TYPES:
                 raise CorruptContentAncestryError()
-                return None
-        return parent_version  # return original content_version
+            unverified_ids.append(block_id)
+            block_id = bytes(string_to_bytes(topics[1]))
+        original_id = self._verified_original_ids[block_id]
+        for block_id in unverified_ids:
+            self._verified_original_ids[block_id] = original_id
+        return original_id
 
     def terminate(self) -> None:
-        self.db.close()
+        if self.db:
+            with self._db_lock:
+                self.db.close()
+                self.db = None
 
     def __del__(self) -> None:
         self.terminate()
@@ -119,4 +629,4 @@ class CorruptContentAncestryError(Exception):
         return "CORRUPT DATA: false original ID found"
 
 
-decorate_all_functions(strictly_typed, __name__)
+apply_strict_typing(__name__)
@@ -0,0 +1,143 @@
+"""A thread-safe least-recently-used cache bounded by entries and bytes."""
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Generic, Hashable, TypeVar
+from .utils import apply_strict_typing
+
+KeyType = TypeVar("KeyType", bound=Hashable)
+ValueType = TypeVar("ValueType")
+
+
+class LRUCache(Generic[KeyType, ValueType]):
+    """A dictionary-like cache that evicts its least recently used entries.
+
+    Entries are evicted once the cache holds more than `max_entries` entries
+    or the sizes of its values add up to more than `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 0,
+        get_size: Callable[[ValueType], int] | None = None,
+        on_evict: Callable[[KeyType, ValueType], None] | None = None,
+    ):
+        """Create an empty cache.
+
+        Args:
+            max_entries: the maximum number of entries, 0 for no limit
+            max_bytes: the maximum total size of all values, 0 for no limit
+            get_size: function that returns the size of a value in bytes,
+                required for `max_bytes` to have any effect
+            on_evict: function to call with the key and value of every entry
+                that gets evicted
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.get_size = get_size
+        self.on_evict = on_evict
+
+        self._entries: OrderedDict[KeyType, tuple[ValueType, int]] = (
+            OrderedDict()
+        )
+        self._lock = Lock()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: KeyType) -> ValueType | None:
+        """Get a cached value, or None if it isn't cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: KeyType, value: ValueType) -> None:
+        """Add a value to the cache, evicting old entries if necessary."""
+        size = self.get_size(value) if self.get_size else 0
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.n_bytes -= old_entry[1]
+            self._entries[key] = (value, size)
+            self.n_bytes += size
+            evicted = self._evict()
+        self._notify_evicted(evicted)
+
+    def refresh_size(self, key: KeyType) -> None:
+        """Recompute the size of a cached value whose size has changed.
+
+        Evicts old entries if the cache now exceeds its size limit.
+        Does nothing if the key isn't cached.
+        """
+        if not self.get_size:
+            return
+        evicted = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, old_size = entry
+                size = self.get_size(value)
+                # doesn't count as a use, so keeps the entry's position
+                self._entries[key] = (value, size)
+                self.n_bytes += size - old_size
+                evicted = self._evict()
+        self._notify_evicted(evicted)
+
+    def _evict(self) -> list[tuple[KeyType, ValueType]]:
+        """Evict the least recently used entries while over the limits."""
+        evicted = []
+        while len(self._entries) > 1 and (
+            (self.max_entries and len(self._entries) > self.max_entries)
+            or (self.max_bytes and self.n_bytes > self.max_bytes)
+        ):
+            old_key, (old_value, old_size) = self._entries.popitem(last=False)
+            self.n_bytes -= old_size
+            self.evictions += 1
+            evicted.append((old_key, old_value))
+        return evicted
+
+    def _notify_evicted(
+        self, evicted: list[tuple[KeyType, ValueType]]
+    ) -> None:
+        if self.on_evict:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def remove(self, key: KeyType) -> None:
+        """Remove an entry from the cache if it exists."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.n_bytes -= entry[1]
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def get_stats(self) -> dict:
+        """Get the cache's usage statistics."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.n_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __contains__(self, key: KeyType) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+apply_strict_typing(__name__)
@@ -0,0 +1,207 @@
+"""A caching proxy around a base blockchain's block retrieval."""
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Iterable
+
+from brenthy_tools_beta.utils import string_to_bytes
+from walytis_beta_api._experimental.generic_blockchain import (
+    GenericBlock,
+    GenericBlockchain,
+)
+
+from .cache import LRUCache
+from .mutablock import DELETION_BLOCK, DELTA_BLOCK, UPDATE_BLOCK
+from .utils import apply_strict_typing, logger
+
+
+class CachingBlockchain(GenericBlockchain):
+    """Wraps a blockchain, caching the blocks retrieved from it.
+
+    Blocks are immutable, so they can be cached indefinitely, limited only
+    by the cache size. A block's content counts towards the cache size once
+    it is loaded, from the next time the block is requested.
+    Concurrent requests for the same block share a single request to the
+    base blockchain, and when a MutaBlock update or deletion block is
+    requested, its parent is prefetched in the background, so that walking
+    a chain of ContentVersions costs one round-trip per missing block.
+    """
+
+    def __init__(
+        self,
+        base_blockchain: GenericBlockchain,
+        max_entries: int = 4096,
+        max_bytes: int = 64 * 1024 * 1024,
+        prefetch_workers: int = 2,
+    ):
+        """Wrap a blockchain.
+
+        Args:
+            base_blockchain: the blockchain to wrap
+            max_entries: the maximum number of blocks to cache
+            max_bytes: the maximum total content size of the cached blocks,
+                0 for no limit
+            prefetch_workers: how many parent blocks may be prefetched
+                concurrently, 0 to disable prefetching
+        """
+        self.base_blockchain = base_blockchain
+        self._cache: LRUCache[bytes, GenericBlock] = LRUCache(
+            max_entries=max_entries,
+            max_bytes=max_bytes,
+            get_size=_get_loaded_size,
+        )
+        # block ID: Future of a request to the base blockchain in progress
+        self._pending: dict[bytes, Future] = {}
+        self._pending_lock = Lock()
+        self.coalesced_requests = 0
+        self.prefetches = 0
+        self._prefetch_executor = (
+            ThreadPoolExecutor(
+                max_workers=prefetch_workers,
+                thread_name_prefix="CachingBlockchain-prefetch",
+            )
+            if prefetch_workers else None
+        )
+        self._block_received_handler: (
+            Callable[[GenericBlock], None] | None
+        ) = None
+
+    @property
+    def blockchain_id(self) -> str:
+        return self.base_blockchain.blockchain_id
+
+    @property
+    def block_received_handler(self) -> Callable[[GenericBlock], None] | None:
+        return self._block_received_handler
+
+    @block_received_handler.setter
+    def block_received_handler(
+        self, block_received_handler: Callable[[GenericBlock], None] | None
+    ) -> None:
+        self._block_received_handler = block_received_handler
+        self.base_blockchain.block_received_handler = (
+            self._on_block_received if block_received_handler else None
+        )
+
+    def _on_block_received(self, block: GenericBlock) -> None:
+        self._cache.put(bytes(block.long_id), block)
+        if self._block_received_handler:
+            self._block_received_handler(block)
+
+    def add_block(
+        self, content: bytes, topics: list[str] | str | None = None
+    ) -> GenericBlock:
+        block = self.base_blockchain.add_block(content, topics)
+        self._cache.put(bytes(block.long_id), block)
+        return block
+
+    def get_block(self, id: bytes | bytearray | int) -> GenericBlock:
+        if isinstance(id, int):
+            return self.base_blockchain.get_block(id)
+        block_id = bytes(id)
+        block = self._cache.get(block_id)
+        if block is None:
+            block = self._fetch(block_id).result()
+        else:
+            # its content may have been loaded since it was cached
+            self._cache.refresh_size(block_id)
+        self._prefetch_parent(block)
+        return block
+
+    def _fetch(self, block_id: bytes) -> Future:
+        """Get a block from the base blockchain, sharing concurrent fetches."""
+        with self._pending_lock:
+            future = self._pending.get(block_id)
+            if future is not None:
+                self.coalesced_requests += 1
+                return future
+            future = Future()
+            self._pending[block_id] = future
+        try:
+            block = self.base_blockchain.get_block(block_id)
+        except Exception as error:
+            future.set_exception(error)
+        else:
+            self._cache.put(block_id, block)
+            future.set_result(block)
+        finally:
+            with self._pending_lock:
+                self._pending.pop(block_id, None)
+        return future
+
+    def _prefetch_parent(self, block: GenericBlock) -> None:
+        """Start loading the parent ContentVersion of a MutaBlock block."""
+        if not self._prefetch_executor:
+            return
+        topics = block.topics
+        if len(topics) < 2 or topics[0] not in {
+            UPDATE_BLOCK, DELETION_BLOCK, DELTA_BLOCK
+        }:
+            return
+        parent_id = bytes(string_to_bytes(topics[1]))
+        if parent_id in self._cache or parent_id in self._pending:
+            return
+        self.prefetches += 1
+        try:
+            self._prefetch_executor.submit(self._prefetch, parent_id)
+        except RuntimeError:  # executor shut down
+            pass
+
+    def _prefetch(self, block_id: bytes) -> None:
+        # doesn't prefetch the block's own parent, only blocks requested
+        # by our caller trigger prefetching
+        if block_id in self._cache:
+            return
+        error = self._fetch(block_id).exception()
+        if error:
+            logger.debug(f"CachingBlockchain: failed to prefetch: {error}")
+
+    def get_cache_stats(self) -> dict:
+        """Get the usage statistics of the block cache.
+
+        Returns:
+            dict: the statistics of the LRU cache, plus the number of
+                `coalesced_requests` and `prefetches`
+        """
+        return self._cache.get_stats() | {
+            "coalesced_requests": self.coalesced_requests,
+            "prefetches": self.prefetches,
+        }
+
+    def get_blocks(self, reverse: bool = False) -> Iterable[GenericBlock]:
+        return self.base_blockchain.get_blocks(reverse=reverse)
+
+    def get_block_ids(self) -> list[bytes]:
+        return self.base_blockchain.get_block_ids()
+
+    def get_num_blocks(self) -> int:
+        return self.base_blockchain.get_num_blocks()
+
+    def get_peers(self) -> list[str]:
+        return self.base_blockchain.get_peers()
+
+    def terminate(self, **kwargs) -> None:
+        if self._prefetch_executor:
+            self._prefetch_executor.shutdown(wait=False, cancel_futures=True)
+        self.base_blockchain.terminate(**kwargs)
+
+    def delete(self) -> None:
+        self.terminate()
+        self.base_blockchain.delete()
+
+    def __getattr__(self, name: str) -> Any:
+        # expose the base blockchain's other attributes, e.g. `appdata_dir`
+        if name == "base_blockchain":
+            raise AttributeError(name)
+        return getattr(self.base_blockchain, name)
+
+
+def _get_loaded_size(block: GenericBlock) -> int:
+    """Get the size of a block's content, 0 if it isn't loaded yet."""
+    # lazily loaded blocks keep their content in `_content` once loaded
+    content = getattr(block, "_content", None)
+    if content is None:
+        content = block.content
+    return len(content)
+
+
+apply_strict_typing(__name__)
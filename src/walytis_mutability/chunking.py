@@ -0,0 +1,135 @@
+"""Storage of large MutaBlock content across multiple base blocks.
+
+Content larger than a MutaBlockchain's chunk size is stored in chunk blocks,
+and the ContentVersion's own block, marked with the CHUNKED_TOPIC, contains
+a manifest listing them.
+`ContentReader` streams content chunk by chunk, so that it never needs to be
+held in memory as a whole.
+
+Manifest layout (little-endian):
+    header: total content size, number of chunks
+    chunks: for each chunk, its size and the length of its block ID,
+            followed by that ID
+"""
+import io
+import struct
+from bisect import bisect_right
+from typing import Callable, Iterator
+
+from .utils import apply_strict_typing
+
+# topic of the base blocks storing chunks of content
+CHUNK_BLOCK = "MutaBlock-Chunk"
+# topic marking a ContentVersion's base block as containing a manifest
+CHUNKED_TOPIC = "MutaBlock-Chunked"
+
+MANIFEST_HEADER = struct.Struct("<QI")
+MANIFEST_ENTRY = struct.Struct("<QH")
+
+
+def encode_manifest(chunks: list[tuple[int, bytes | bytearray]]) -> bytes:
+    """Encode a manifest given the size and block ID of each chunk."""
+    manifest = bytearray(MANIFEST_HEADER.pack(
+        sum(size for size, _ in chunks), len(chunks)
+    ))
+    for size, block_id in chunks:
+        manifest += MANIFEST_ENTRY.pack(size, len(block_id)) + bytes(block_id)
+    return bytes(manifest)
+
+
+def decode_manifest(manifest: bytes | bytearray) -> list[tuple[int, bytes]]:
+    """Get the size and block ID of each chunk listed in a manifest."""
+    _, n_chunks = MANIFEST_HEADER.unpack_from(manifest)
+    position = MANIFEST_HEADER.size
+    chunks = []
+    for _ in range(n_chunks):
+        size, len_block_id = MANIFEST_ENTRY.unpack_from(manifest, position)
+        position += MANIFEST_ENTRY.size
+        block_id = bytes(manifest[position:position + len_block_id])
+        chunks.append((size, block_id))
+        position += len_block_id
+    return chunks
+
+
+class ContentReader(io.RawIOBase):
+    """A read-only, seekable file object over content stored in chunks.
+
+    Only the chunk currently being read is held in memory.
+    """
+
+    def __init__(
+        self, chunks: list[tuple[int, Callable[[], bytes | bytearray]]]
+    ):
+        """Create a reader.
+
+        Args:
+            chunks: the size of each chunk and a function loading it
+        """
+        io.RawIOBase.__init__(self)
+        self._chunks = chunks
+        # offset in the content at which each chunk starts
+        self._offsets = []
+        offset = 0
+        for size, _ in chunks:
+            self._offsets.append(offset)
+            offset += size
+        self.size = offset
+        self._position = 0
+        self._loaded_index = -1
+        self._loaded_chunk = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Negative seek position.")
+        self._position = offset
+        return offset
+
+    def _get_chunk(self, index: int) -> memoryview:
+        if index != self._loaded_index:
+            self._loaded_chunk = memoryview(self._chunks[index][1]())
+            self._loaded_index = index
+        return self._loaded_chunk
+
+    def readinto(self, buffer) -> int:
+        buffer = memoryview(buffer).cast("B")
+        n_read = 0
+        # fill the buffer across chunk boundaries, so reads are never short
+        while n_read < len(buffer) and self._position < self.size:
+            index = bisect_right(self._offsets, self._position) - 1
+            chunk = self._get_chunk(index)
+            start = self._position - self._offsets[index]
+            length = min(len(buffer) - n_read, len(chunk) - start)
+            buffer[n_read:n_read + length] = chunk[start:start + length]
+            self._position += length
+            n_read += length
+        return n_read
+
+    def iter_chunks(self) -> Iterator[memoryview]:
+        """Iterate over the remaining content, one chunk at a time."""
+        while self._position < self.size:
+            index = bisect_right(self._offsets, self._position) - 1
+            chunk = self._get_chunk(index)
+            start = self._position - self._offsets[index]
+            self._position += len(chunk) - start
+            yield chunk[start:]
+
+    def close(self) -> None:
+        self._loaded_chunk = memoryview(b"")
+        self._loaded_index = -1
+        io.RawIOBase.close(self)
+
+
+apply_strict_typing(__name__)
@@ -0,0 +1,80 @@
+"""Compression of MutaBlock content stored on the base blockchain.
+
+Compressed base blocks carry a topic naming their codec, so that readers
+can decompress them transparently.
+Codecs are looked up by name in a registry, to which applications can add
+their own with `register_codec`.
+"""
+import lzma
+import zlib
+from typing import Callable
+
+from .utils import apply_strict_typing
+
+# prefix of the topic marking a base block's content as compressed,
+# followed by the codec's name
+CODEC_TOPIC_PREFIX = "MutaBlock-Codec:"
+
+# codec name: (compress function, decompress function)
+_codecs: dict[
+    str, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]
+] = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+def register_codec(
+    name: str,
+    compress: Callable[[bytes], bytes],
+    decompress: Callable[[bytes], bytes],
+) -> None:
+    """Make a compression codec available for use and decoding.
+
+    Args:
+        name: the codec's name, recorded in the topics of the blocks it
+            compresses, so it must be the same for all readers
+        compress: function compressing content
+        decompress: function reversing `compress`
+    """
+    _codecs[name] = (compress, decompress)
+
+
+def get_codec_names() -> list[str]:
+    """Get the names of the available codecs."""
+    return list(_codecs.keys())
+
+
+def is_codec_topic(topic: str) -> bool:
+    return topic.startswith(CODEC_TOPIC_PREFIX)
+
+
+def compress(
+    content: bytes | bytearray, codec: str
+) -> tuple[bytes, str]:
+    """Compress content, getting the compressed content and codec topic."""
+    if codec not in _codecs:
+        raise UnknownCodecError(f"Unknown compression codec: {codec}")
+    return _codecs[codec][0](bytes(content)), CODEC_TOPIC_PREFIX + codec
+
+
+def decompress(
+    content: bytes | bytearray, topics: list[str]
+) -> bytes | bytearray:
+    """Decompress a base block's content if its topics mark it compressed."""
+    for topic in topics:
+        if is_codec_topic(topic):
+            codec = topic[len(CODEC_TOPIC_PREFIX):]
+            if codec not in _codecs:
+                raise UnknownCodecError(
+                    f"Content compressed with unknown codec: {codec}"
+                )
+            return _codecs[codec][1](bytes(content))
+    return content
+
+
+class UnknownCodecError(Exception):
+    pass
+
+
+apply_strict_typing(__name__)
@@ -0,0 +1,87 @@
+"""Binary deltas between versions of MutaBlock content.
+
+A delta stores the lengths of the prefix and suffix that the new content
+shares with the old content, plus the bytes in between, which suits the
+typical edit changing one region of a document.
+Each delta also records its depth, the number of deltas that must be
+applied to the nearest full version to reconstruct it, so that writers
+can bound reconstruction cost by inserting full versions (keyframes).
+"""
+import struct
+
+from .utils import apply_strict_typing
+
+HEADER = struct.Struct("<IQQ")  # depth, prefix length, suffix length
+
+
+def _common_prefix_length(a: memoryview, b: memoryview) -> int:
+    # binary search, so that the comparisons run in C
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(a: memoryview, b: memoryview, limit: int) -> int:
+    low, high = 0, min(len(a), len(b), limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:] == b[len(b) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def encode_delta(
+    old: bytes | bytearray, new: bytes | bytearray, depth: int
+) -> bytes:
+    """Encode new content as a delta against old content.
+
+    Args:
+        old: the content the delta is applied to
+        new: the content the delta reconstructs
+        depth: the number of deltas between `new` and the last full version,
+            including this one
+    Returns:
+        bytes: the delta
+    """
+    old_view, new_view = memoryview(old), memoryview(new)
+    prefix = _common_prefix_length(old_view, new_view)
+    suffix = _common_suffix_length(
+        old_view[prefix:], new_view[prefix:], len(new) - prefix
+    )
+    return (
+        HEADER.pack(depth, prefix, suffix)
+        + bytes(new_view[prefix:len(new) - suffix])
+    )
+
+
+def apply_delta(old: bytes | bytearray, delta: bytes | bytearray) -> bytes:
+    """Reconstruct content from the content a delta was encoded against."""
+    _, prefix, suffix = HEADER.unpack_from(delta)
+    if prefix + suffix > len(old):
+        raise InvalidDeltaError(
+            "Delta doesn't match the content it's applied to."
+        )
+    return (
+        bytes(old[:prefix])
+        + bytes(delta[HEADER.size:])
+        + bytes(old[len(old) - suffix:])
+    )
+
+
+def get_delta_depth(delta: bytes | bytearray) -> int:
+    """Get the number of deltas between a delta's content and full content."""
+    return HEADER.unpack_from(delta)[0]
+
+
+class InvalidDeltaError(Exception):
+    pass
+
+
+apply_strict_typing(__name__)
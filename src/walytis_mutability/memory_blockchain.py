@@ -0,0 +1,113 @@
+"""An in-memory stand-in for a Walytis blockchain, for tests and benchmarks.
+
+Blocks are kept in a dict, so no Brenthy or IPFS node is needed and
+measurements reflect the cost of the MutaBlockchain overlay itself.
+"""
+
+import os
+from threading import Lock
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from walytis_beta_api import BlockNotFoundError
+from walytis_beta_api._experimental.generic_blockchain import (
+    GenericBlock,
+    _GenericBlockchainImpl,
+)
+from walytis_beta_tools._experimental.generic_block import _GenericBlockImpl
+
+
+class MemoryBlock(_GenericBlockImpl):
+    """A block that lives only in memory."""
+
+    def __init__(
+        self,
+        long_id: bytes,
+        content: bytes | bytearray,
+        topics: list[str],
+        creation_time: datetime,
+    ):
+        _GenericBlockImpl.__init__(self)
+        self._long_id = bytearray(long_id)
+        self._short_id = bytearray(long_id.split(bytes(4))[0])
+        self._content = content
+        self._topics = topics
+        self._creation_time = creation_time
+
+
+class MemoryBlockchain(_GenericBlockchainImpl):
+    """A blockchain that keeps all its blocks in memory."""
+
+    def __init__(
+        self,
+        block_received_handler: Callable[[GenericBlock], None] | None = None,
+    ):
+        _GenericBlockchainImpl.__init__(self)
+        self.blockchain_id = os.urandom(8).hex()
+        self.block_received_handler = block_received_handler
+        self._blocks: dict[bytes, MemoryBlock] = {}
+        self._last_time = datetime.now(timezone.utc)
+        self._time_lock = Lock()
+
+    def _next_time(self) -> datetime:
+        # ensure strictly increasing creation times like on a real node
+        with self._time_lock:
+            now = datetime.now(timezone.utc)
+            if now <= self._last_time:
+                now = self._last_time + timedelta(microseconds=1)
+            self._last_time = now
+            return now
+
+    def create_block(
+        self, content: bytes | bytearray, topics: list[str] | str | None = None
+    ) -> MemoryBlock:
+        """Create a block without adding it to this blockchain."""
+        if topics is None:
+            topics = []
+        elif isinstance(topics, str):
+            topics = [topics]
+        # long IDs contain [0, 0, 0, 0] separating short ID and parents
+        long_id = os.urandom(16) + bytes(4) + os.urandom(8)
+        return MemoryBlock(long_id, content, list(topics), self._next_time())
+
+    def receive_block(self, block: MemoryBlock) -> None:
+        """Add a block as if it was received from a peer."""
+        self._blocks[bytes(block.long_id)] = block
+        if self.block_received_handler:
+            self.block_received_handler(block)
+
+    def add_block(
+        self, content: bytes | bytearray, topics: list[str] | str | None = None
+    ) -> MemoryBlock:
+        block = self.create_block(content, topics)
+        self.receive_block(block)
+        return block
+
+    def get_blocks(self, reverse: bool = False) -> list[MemoryBlock]:
+        blocks = list(self._blocks.values())
+        if reverse:
+            blocks.reverse()
+        return blocks
+
+    def get_block_ids(self) -> list[bytes]:
+        return list(self._blocks.keys())
+
+    def get_num_blocks(self) -> int:
+        return len(self._blocks)
+
+    def get_block(self, id: bytes | bytearray | int) -> MemoryBlock:
+        if isinstance(id, int):
+            return self.get_blocks()[id]
+        try:
+            return self._blocks[bytes(id)]
+        except KeyError:
+            raise BlockNotFoundError() from None
+
+    def get_peers(self) -> list[str]:
+        return []
+
+    def terminate(self, **kwargs) -> None:
+        pass
+
+    def delete(self) -> None:
+        self._blocks.clear()
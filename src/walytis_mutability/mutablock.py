@@ -1,13 +1,12 @@
 from __future__ import annotations
-from typing import Generic, Type, TypeVar
-from decorate_all import decorate_all_functions
-from strict_typing import strictly_typed
-from dataclasses import dataclass
+from typing import Callable, Generic, Type, TypeVar
 from datetime import datetime
 from walytis_beta_tools._experimental.block_lazy_loading import BlocksList, BlockNotFoundError
 from walytis_beta_api._experimental.generic_blockchain import  GenericBlock
 from brenthy_tools_beta.utils import bytes_to_string
 from typing import TYPE_CHECKING
+from .chunking import ContentReader
+from .utils import apply_strict_typing
 
 if TYPE_CHECKING:
     from .mutablockchain import MutaBlockchain  # Only imported for type checking
@@ -16,8 +15,11 @@ if TYPE_CHECKING:
 ORIGINAL_BLOCK = "MutaBlock-Original"
 UPDATE_BLOCK = "MutaBlock-Update"
 DELETION_BLOCK = "MutaBlock-Deletion"
+# an update whose content is a delta against its parent's content,
+# its ContentVersions have the type UPDATE_BLOCK
+DELTA_BLOCK = "MutaBlock-Delta"
 
-BLOCK_TYPES = {ORIGINAL_BLOCK, UPDATE_BLOCK, DELETION_BLOCK}
+BLOCK_TYPES = {ORIGINAL_BLOCK, UPDATE_BLOCK, DELETION_BLOCK, DELTA_BLOCK}
 
 
 class MutaBlock(GenericBlock):
@@ -37,18 +39,65 @@ class MutaBlock(GenericBlock):
     def get_content_version_ids(self):
         return self.mutablockchain.get_mutablock_content_version_ids(self.long_id)
 
-    def get_current_content_version(self) -> dict:
+    def get_versions_between(
+        self, start: datetime | None = None, end: datetime | None = None
+    ) -> list[ContentVersion]:
+        """Get this MutaBlock's ContentVersions created in a time range."""
+        return [
+            self.mutablockchain.get_content_version(cv_id)
+            for cv_id in self.mutablockchain.get_content_version_ids_between(
+                start, end, self.long_id
+            )
+        ]
+
+    def content_version_at(self, time: datetime) -> ContentVersion | None:
+        """Get the ContentVersion that was current at the given time.
+
+        Returns:
+            ContentVersion | None: the latest ContentVersion created no later
+                than `time`, None if this MutaBlock didn't exist yet
+        """
+        return self.mutablockchain.get_mutablock_version_at(self.long_id, time)
+
+    def content_at(self, time: datetime) -> bytearray | bytes | None:
+        """Get this MutaBlock's content as of the given time.
+
+        Returns:
+            bytearray | bytes | None: the content, None if this MutaBlock
+                didn't exist yet or had been deleted at that time
+        """
+        content_version = self.content_version_at(time)
+        if not content_version or content_version.type == DELETION_BLOCK:
+            return None
+        return content_version.content
+
+    def open(self) -> ContentReader:
+        """Open the current content as a read-only file object.
+
+        Large content stored in chunks is streamed chunk by chunk instead of
+        being loaded into memory as a whole.
+        """
+        return self.mutablockchain.open_content(
+            self.mutablockchain.get_mutablock_head_id(self.long_id)
+        )
+
+    def get_current_content_version(self) -> ContentVersion:
         """Get the compilation of the multiple ContentVersion's content."""
-        return self.get_content_versions()[-1]
+        return self.mutablockchain.get_mutablock_head(self.long_id)
 
-    def edit(self, content: bytes) -> None:
+    def edit(
+        self, content: bytes, topics: list[str] | str | None = None
+    ) -> None:
         self.mutablockchain.edit_block(
-            self.get_content_version_ids()[-1],
-            content
+            self.mutablockchain.get_mutablock_head_id(self.long_id),
+            content,
+            topics,
         )
 
     def delete(self) -> None:
-        self.mutablockchain.delete_block(self.get_content_version_ids()[-1])
+        self.mutablockchain.delete_block(
+            self.mutablockchain.get_mutablock_head_id(self.long_id)
+        )
 
     @property
     def ipfs_cid(self):
@@ -72,7 +121,8 @@ class MutaBlock(GenericBlock):
 
     @property
     def topics(self):
-        return self.base_block.topics[1:]
+        """The user topics of the MutaBlock's latest version."""
+        return self.mutablockchain.get_mutablock_topics(self.long_id)
 
     @property
     def content(self):
@@ -87,15 +137,92 @@ class MutaBlock(GenericBlock):
         return self.base_block.file_data
 
 
-@dataclass
 class ContentVersion:
-    type: str
-    cv_id: bytearray | bytes  # same as the block ID that created this content version
-    parent_id: bytearray | bytes
-    original_id: bytearray | bytes
-    content: bytearray | bytes
-    timestamp: datetime
-    topics: list[str]
+    """A version of a MutaBlock's content.
+
+    If a `content_loader` is provided instead of the content, the content is
+    only loaded when it is first accessed, so that ContentVersions can be
+    listed and inspected without holding their payloads in memory.
+    ContentVersions are equal if their metadata is, their content isn't
+    compared.
+    """
+
+    def __init__(
+        self,
+        type: str,
+        # same as the block ID that created this content version
+        cv_id: bytearray | bytes,
+        parent_id: bytearray | bytes,
+        original_id: bytearray | bytes,
+        content: bytearray | bytes | None,
+        timestamp: datetime,
+        topics: list[str],
+        content_loader: Callable[[], bytearray | bytes] | None = None,
+        creator_id: bytearray | bytes = b"",
+        loaded_size_handler: Callable[[ContentVersion], None] | None = None,
+    ):
+        if content is None and content_loader is None:
+            raise ValueError("Provide either content or content_loader.")
+        self.type = type
+        self.cv_id = cv_id
+        self.parent_id = parent_id
+        self.original_id = original_id
+        self.timestamp = timestamp
+        self.topics = topics
+        self.creator_id = creator_id
+        self._content = content
+        self._content_loader = content_loader
+        # called whenever `loaded_size` changes, e.g. to account for it
+        self.loaded_size_handler = loaded_size_handler
+
+    @property
+    def content(self) -> bytearray | bytes:
+        content = self._content
+        if content is None:
+            content = self._content_loader()
+            self._content = content
+            if self.loaded_size_handler:
+                self.loaded_size_handler(self)
+        return content
+
+    @property
+    def is_content_loaded(self) -> bool:
+        return self._content is not None
+
+    @property
+    def loaded_size(self) -> int:
+        """The number of bytes of content this object currently holds."""
+        return len(self._content) if self._content is not None else 0
+
+    def release_content(self) -> None:
+        """Free the loaded content from memory, to be reloaded if needed."""
+        if self._content_loader is not None and self._content is not None:
+            self._content = None
+            if self.loaded_size_handler:
+                self.loaded_size_handler(self)
+
+    def _get_metadata(self) -> tuple:
+        return (
+            self.type,
+            bytes(self.cv_id),
+            bytes(self.parent_id),
+            bytes(self.original_id),
+            self.timestamp,
+            self.topics,
+            bytes(self.creator_id),
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ContentVersion):
+            return False
+        return self._get_metadata() == other._get_metadata()
+
+    def __repr__(self) -> str:
+        return (
+            f"ContentVersion(type={self.type!r}, cv_id={self.cv_id!r}, "
+            f"parent_id={self.parent_id!r}, original_id={self.original_id!r}, "
+            f"timestamp={self.timestamp!r}, topics={self.topics!r})"
+        )
 
 
 # a type variable restricted to subclasses of Block
@@ -151,4 +278,4 @@ class MutaBlocksList(BlocksList[BlockType]):
         return block
 
 
-decorate_all_functions(strictly_typed, __name__)
+apply_strict_typing(__name__)
@@ -1,26 +1,49 @@
 """A virtual Blockchain with mutable blocks."""
 
-from typing import Callable
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from threading import RLock, local
+from typing import Callable, Generator
 
 import walytis_beta_api
 from brenthy_tools_beta.utils import bytes_to_string, string_to_bytes
-from decorate_all import decorate_all_functions
-from strict_typing import strictly_typed
-from walytis_beta_api import Block, Blockchain
+from walytis_beta_api import Block, BlockNotFoundError, Blockchain
 from walytis_beta_api._experimental.generic_blockchain import (
     GenericBlock,
     GenericBlockchain,
 )
-from .blockstore import BlockStore
+from .blockstore import BlockStore, CorruptContentAncestryError
+from .caching_blockchain import CachingBlockchain
+from .chunking import CHUNK_BLOCK, CHUNKED_TOPIC, encode_manifest
+from .compression import compress, decompress, is_codec_topic
+from .delta import encode_delta, get_delta_depth
 from .mutablock import (
+    BLOCK_TYPES,
     DELETION_BLOCK,
+    DELTA_BLOCK,
     ORIGINAL_BLOCK,
     UPDATE_BLOCK,
     ContentVersion,
     MutaBlock,
     MutaBlocksList,
 )
-from .utils import logger
+from .notifications import (
+    CoalescedBlock,
+    NotificationCoalescer,
+    ReceivedBlock,
+)
+from .orphans import OrphanBuffer
+from .receive_pipeline import ReceivePipeline
+from .snapshot import MappedSnapshot, SnapshotRecord, write_snapshot
+from .utils import apply_strict_typing, logger
+
+
+# how many base blocks `ingest_blocks` processes per database commit
+INGESTION_BATCH_SIZE = 4096
 
 
 class MutaBlockchain(BlockStore, GenericBlockchain):
@@ -33,66 +56,479 @@ class MutaBlockchain(BlockStore, GenericBlockchain):
         auto_load_missed_blocks: bool = True,
         forget_appdata: bool = False,
         sequential_block_handling: bool = True,
+        appdata_dir: str = "",
+        cache_max_entries: int = 1024,
+        cache_max_bytes: int = 64 * 1024 * 1024,
+        max_write_workers: int = 4,
+        snapshot_path: str = "",
+        cache_base_blocks: bool = False,
+        base_cache_max_entries: int = 4096,
+        base_cache_max_bytes: int = 64 * 1024 * 1024,
+        exclude_deleted_blocks: bool = False,
+        delta_updates: bool = False,
+        keyframe_interval: int = 16,
+        codec: str = "",
+        compression_threshold: int = 1024,
+        chunk_size: int = 0,
+        max_sync_workers: int = 8,
+        max_orphans: int = 10000,
+        orphan_ttl: float = 600.0,
+        receive_workers: int = 0,
+        receive_queue_size: int = 1024,
+        coalesce_window: float = 0.0,
+        coalesce_max_versions: int = 100,
     ):
-        # self.db_path = os.path.join(
-        #     appdirs.user_data_dir(),
-        #     "MutaBlockchains",
-        #     blockchain_id
-        # )
+        """Create a MutaBlockchain overlay on top of a base blockchain.
+
+        Args:
+            base_blockchain: the blockchain on which to store MutaBlocks
+            block_received_handler: function to be called every time a new
+                block is received on this blockchain, with a ReceivedBlock
+            auto_load_missed_blocks: whether or not to process the base
+                blocks added since this MutaBlockchain was last loaded.
+                Only blocks added since the checkpoint saved on the last
+                termination are processed.
+            forget_appdata: whether or not to delete any existing
+                content-version database before loading
+            sequential_block_handling: with `receive_workers`, whether
+                received blocks are processed strictly in the order they
+                arrive, by a single worker, or in parallel across
+                MutaBlocks, keeping the order of each MutaBlock's blocks
+            appdata_dir: the directory in which to store the content-version
+                database. Defaults to a subdirectory of the base blockchain's
+                `appdata_dir` if it has one, otherwise the database is kept
+                in memory only.
+            cache_max_entries: how many decoded ContentVersions to keep in
+                memory for repeated access, 0 for no limit. MutaBlocks'
+                current heads are always kept, not counting towards it.
+            cache_max_bytes: the maximum total content size in bytes of the
+                ContentVersions kept in memory, 0 for no limit. Applies
+                separately to the content of MutaBlocks' current heads.
+            max_write_workers: how many base blocks `add_blocks`,
+                `edit_blocks` and `delete_blocks` may create concurrently
+            snapshot_path: the path of a snapshot created with
+                `export_snapshot` to bootstrap from, see `load_snapshot`
+            cache_base_blocks: whether or not to access the base blockchain
+                through a CachingBlockchain, which caches the base blocks,
+                shares concurrent requests for the same block and prefetches
+                the parents of update blocks.
+                Worthwhile if the base blockchain's `get_block` is slow.
+            base_cache_max_entries: how many base blocks the CachingBlockchain
+                may keep in memory
+            base_cache_max_bytes: the maximum total content size in bytes of
+                the base blocks the CachingBlockchain keeps in memory
+            exclude_deleted_blocks: whether or not `get_blocks`,
+                `get_block_ids`, `get_num_blocks` and `find_blocks` should
+                leave out deleted MutaBlocks, like `get_live_blocks` etc.
+            delta_updates: whether or not edits should store only the
+                difference to the previous content, where that's smaller
+            keyframe_interval: with `delta_updates`, the maximum number of
+                consecutive delta updates before the full content is stored
+                again, bounding the cost of reconstructing content
+            codec: the name of the compression codec with which to store
+                content, e.g. "zlib" or "lzma", see `register_codec`.
+                Empty for no compression.
+            compression_threshold: the minimum size in bytes of content
+                to compress
+            chunk_size: the maximum number of bytes of content to store in
+                a single base block, larger content is split into chunks
+                which `MutaBlock.open` can stream. 0 for no limit.
+            max_sync_workers: how many base blocks `ingest_blocks` may
+                load and decode concurrently, also used when catching up
+                with missed blocks
+            max_orphans: how many blocks received before their parents may
+                be kept waiting for them
+            orphan_ttl: how many seconds a block received before its parent
+                may wait for it. Blocks dropped after waiting too long, or
+                to make space for others, are processed on the next startup
+            receive_workers: how many threads process the blocks the base
+                blockchain receives, 0 to process them on the base
+                blockchain's callback thread. Worker threads decouple the
+                base blockchain from a slow `block_received_handler`.
+                Our own writes are always processed immediately.
+            receive_queue_size: with `receive_workers`, how many received
+                blocks may wait for each worker before the base blockchain's
+                callback blocks
+            coalesce_window: if set, the `block_received_handler` is
+                called at most once per MutaBlock per this many seconds,
+                with a CoalescedBlock: the MutaBlock's new head, with its
+                content, listing the IDs of the other versions received as
+                `intermediate_version_ids`. Not called if the received
+                blocks don't change the MutaBlock's head
+            coalesce_max_versions: with `coalesce_window`, the number of
+                blocks of a MutaBlock after which the notification is
+                delivered without waiting for the window to end
+        """
+        if cache_base_blocks:
+            base_blockchain = CachingBlockchain(
+                base_blockchain,
+                max_entries=base_cache_max_entries,
+                max_bytes=base_cache_max_bytes,
+            )
         self.base_blockchain = base_blockchain
-        block_ids = [
-            bytes(block.long_id)
-            for block in self.base_blockchain._blocks.get_blocks()
-            if block.topics[0] == ORIGINAL_BLOCK
-        ]
+        self.auto_load_missed_blocks = auto_load_missed_blocks
+        self.exclude_deleted_blocks = exclude_deleted_blocks
+        self.delta_updates = delta_updates
+        self.keyframe_interval = keyframe_interval
+        self.codec = codec
+        self.compression_threshold = compression_threshold
+        self.chunk_size = chunk_size
+        self.max_write_workers = max_write_workers
+        self.max_sync_workers = max_sync_workers
+        self._receive_lock = RLock()
+        # the batch operation running on each thread: its `depth`, the
+        # number of nested batch operations, and its `notifications`, the
+        # blocks to pass to block_received_handler when it ends
+        self._batch = local()
+        # blocks received before their parents
+        self._orphans: OrphanBuffer[GenericBlock] = OrphanBuffer(
+            max_size=max_orphans,
+            ttl=orphan_ttl,
+            on_drop=self._on_orphan_dropped,
+        )
+        # IDs of orphans dropped from the buffer, not processed yet
+        self._dropped_orphan_ids: set[bytes] = set()
+        if not appdata_dir and getattr(base_blockchain, "appdata_dir", ""):
+            appdata_dir = os.path.join(
+                base_blockchain.appdata_dir, "MutaBlockchain"
+            )
+        BlockStore.__init__(self)
+        self.init_blockstore(
+            appdata_dir,
+            forget_appdata=forget_appdata,
+            cache_max_entries=cache_max_entries,
+            cache_max_bytes=cache_max_bytes,
+        )
+        # loaded snapshots, kept open to serve their content
+        self._snapshots: list[MappedSnapshot] = []
+        # ContentVersion ID: function reading its content from a snapshot
+        self._snapshot_contents: dict[bytes, Callable[[], bytes]] = {}
 
         self._blocks = MutaBlocksList.from_block_ids(
-            block_ids, self, MutaBlock
+            self.get_mutablock_ids(), self, MutaBlock
         )
-        BlockStore.__init__(self)
-        self.init_blockstore()
 
         self.block_received_handler = block_received_handler
-        self.base_blockchain.block_received_handler = self._on_block_received
+        self._coalescer: NotificationCoalescer | None = None
+        if coalesce_window > 0:
+            self._coalescer = NotificationCoalescer(
+                self._deliver_coalesced,
+                self.get_mutablock_head,
+                window=coalesce_window,
+                max_versions=coalesce_max_versions,
+            )
+        self._receive_pipeline: ReceivePipeline[GenericBlock] | None = None
+        if receive_workers:
+            self._receive_pipeline = ReceivePipeline(
+                self._on_block_received,
+                n_workers=1 if sequential_block_handling else receive_workers,
+                queue_size=receive_queue_size,
+                get_shard_key=self._get_receive_shard_key,
+                name="MutaBlockchain-receive",
+            )
+            self.base_blockchain.block_received_handler = (
+                self._receive_pipeline.submit
+            )
+        else:
+            self.base_blockchain.block_received_handler = (
+                self._on_block_received
+            )
+        if snapshot_path:
+            self._import_snapshot(snapshot_path)
+        if auto_load_missed_blocks:
+            self._load_missed_blocks()
         # self.base_blockchain.load_missed_blocks(
         #     walytis_beta_api.blockchain_model.N_STARTUP_BLOCKS
         # )
 
     def add_block(
-        self, content: bytes | bytearray, topics: list[str] | str = ""
+        self,
+        content: bytes | bytearray,
+        topics: list[str] | str = "",
+        codec: str | None = None,
     ) -> MutaBlock:
-        if topics == "" or topics is None:
-            topics = []
-        elif isinstance(topics, str) or topics is None:
-            topics = [topics]
-        topics = [ORIGINAL_BLOCK] + topics
-        block = self.base_blockchain.add_block(content, topics)
+        """Create a new MutaBlock.
+
+        Args:
+            content: the MutaBlock's content
+            topics: the MutaBlock's user topics, which can't be the
+                `MutaBlock-Chunked` or `MutaBlock-Codec:` encoding markers
+            codec: the compression codec to use instead of this
+                MutaBlockchain's `codec`, empty for no compression
+        """
+        block = self.base_blockchain.add_block(*self._encode_write(
+            (content, self._get_original_topics(topics)), codec
+        ))
         self._on_block_received(block)
-        print("Created mutablock.")
+        logger.debug("Created mutablock.")
         return MutaBlock(block, self)
 
     def edit_block(
-        self, parent_id: bytes | bytearray, content: bytes | bytearray
+        self,
+        parent_id: bytes | bytearray,
+        content: bytes | bytearray,
+        topics: list[str] | str | None = None,
+        codec: str | None = None,
     ) -> None:
-        print("Editing mutablock")
+        """Create a new version of a MutaBlock.
 
-        if isinstance(parent_id, (bytearray, bytes)):
-            parent_id = bytes_to_string(parent_id)
-        topics = [UPDATE_BLOCK, parent_id]
-        print("Adding block...")
-        block = self.base_blockchain.add_block(content, topics=topics)
-        print("Createed update block")
+        Args:
+            parent_id: the ID of the MutaBlock's current ContentVersion
+            content: the new content
+            topics: new user topics for the MutaBlock, by default it keeps
+                its current topics; like in `add_block`, they can't be the
+                encoding markers
+            codec: the compression codec to use instead of this
+                MutaBlockchain's `codec`, empty for no compression
+        """
+        logger.debug("Editing mutablock...")
+        block = self.base_blockchain.add_block(*self._encode_write(
+            self._get_update_write(parent_id, content, topics), codec
+        ))
+        logger.debug("Created update block.")
         self._on_block_received(block)
 
     def delete_block(self, parent_id: bytearray | bytes) -> None:
-        if isinstance(parent_id, ContentVersion):
-            parent_id = parent_id.cv_id
-        topics = [DELETION_BLOCK, bytes_to_string(parent_id)]
         block = self.base_blockchain.add_block(
-            content=bytearray([3]), topics=topics
+            content=bytearray([3]), topics=self._get_deletion_topics(parent_id)
         )
         self._on_block_received(block)
 
+    def add_blocks(
+        self,
+        blocks: list[
+            bytes | bytearray | tuple[bytes | bytearray, list[str] | str]
+        ],
+    ) -> list[MutaBlock]:
+        """Create multiple MutaBlocks at once.
+
+        The base blocks are created concurrently, and the
+        `block_received_handler` is only called once all of them have been
+        processed.
+
+        Args:
+            blocks: the contents of the new MutaBlocks, or tuples of
+                content and topics
+        Returns:
+            list[MutaBlock]: the new MutaBlocks, in the given order
+        """
+        writes = []
+        for block in blocks:
+            if isinstance(block, tuple):
+                content, topics = block
+            else:
+                content, topics = block, ""
+            writes.append(self._encode_write(
+                (content, self._get_original_topics(topics))
+            ))
+        return [
+            MutaBlock(block, self) for block in self._add_base_blocks(writes)
+        ]
+
+    def edit_blocks(self, edits: dict[bytes, bytes | bytearray]) -> None:
+        """Edit multiple MutaBlocks at once.
+
+        Args:
+            edits: the new content of each MutaBlock, keyed by the ID of
+                the ContentVersion it replaces
+        """
+        self._add_base_blocks([
+            self._encode_write(self._get_update_write(parent_id, content))
+            for parent_id, content in edits.items()
+        ])
+
+    def delete_blocks(self, parent_ids: list[bytes | bytearray]) -> None:
+        """Delete multiple MutaBlocks at once.
+
+        Args:
+            parent_ids: the IDs of the MutaBlocks' current ContentVersions
+        """
+        self._add_base_blocks([
+            (bytearray([3]), self._get_deletion_topics(parent_id))
+            for parent_id in parent_ids
+        ])
+
+    def _add_base_blocks(
+        self, writes: list[tuple[bytes | bytearray, list[str]]]
+    ) -> list[GenericBlock]:
+        """Create base blocks concurrently, processing them as one batch."""
+        with self._batch_processing():
+            if self.max_write_workers > 1 and len(writes) > 1:
+                with ThreadPoolExecutor(
+                    max_workers=self.max_write_workers,
+                    # blocks processed on the workers belong to the batch
+                    initializer=self._join_batch,
+                    initargs=(self._batch.notifications,),
+                ) as executor:
+                    blocks = list(executor.map(
+                        lambda write: self.base_blockchain.add_block(*write),
+                        writes
+                    ))
+            else:
+                blocks = [
+                    self.base_blockchain.add_block(*write) for write in writes
+                ]
+            for block in blocks:
+                self._on_block_received(block)
+        return blocks
+
+    @contextmanager
+    def _batch_processing(self) -> Generator[None, None, None]:
+        """Defer database commits and handler calls until the batch ends.
+
+        Applies to the blocks processed on the current thread, blocks
+        received on other threads meanwhile are processed as usual.
+        """
+        if not self._is_in_batch():
+            self._batch.notifications = []
+        self._batch.depth = getattr(self._batch, "depth", 0) + 1
+        try:
+            yield
+        finally:
+            self._batch.depth -= 1
+            if not self._batch.depth:
+                self.commit_content_versions()
+                notifications = self._batch.notifications
+                self._batch.notifications = []
+                self._notify(notifications)
+
+    def _join_batch(self, notifications: list[GenericBlock]) -> None:
+        """Make the current thread part of another thread's batch."""
+        self._batch.depth = 1
+        self._batch.notifications = notifications
+
+    def _is_in_batch(self) -> bool:
+        """Check if the current thread is running a batch operation."""
+        return getattr(self._batch, "depth", 0) > 0
+
+    @staticmethod
+    def _get_user_topics(topics: list[str] | str | None) -> list[str]:
+        """Get a list of user topics, rejecting our internal markers."""
+        if topics == "" or topics is None:
+            topics = []
+        elif isinstance(topics, str):
+            topics = [topics]
+        for topic in topics:
+            # they mark how the content is encoded
+            if is_codec_topic(topic) or topic == CHUNKED_TOPIC:
+                raise ReservedTopicError(
+                    f"Topic {topic!r} is reserved for MutaBlockchain's "
+                    "internal use."
+                )
+        return topics
+
+    @staticmethod
+    def _get_original_topics(topics: list[str] | str | None) -> list[str]:
+        return [ORIGINAL_BLOCK] + MutaBlockchain._get_user_topics(topics)
+
+    @staticmethod
+    def _get_update_topics(
+        parent_id: bytes | bytearray | str,
+        topics: list[str] | str | None = None,
+    ) -> list[str]:
+        if isinstance(parent_id, (bytearray, bytes)):
+            parent_id = bytes_to_string(parent_id)
+        return [UPDATE_BLOCK, parent_id] + MutaBlockchain._get_user_topics(
+            topics
+        )
+
+    def _get_update_write(
+        self,
+        parent_id: bytes | bytearray,
+        content: bytes | bytearray,
+        topics: list[str] | str | None = None,
+    ) -> tuple[bytes | bytearray, list[str]]:
+        """Get the content and topics of the base block for an edit."""
+        update_topics = self._get_update_topics(parent_id, topics)
+        if not self.delta_updates or self._needs_chunking(content):
+            return content, update_topics
+        parent_block = self.base_blockchain.get_block(parent_id)
+        depth = (
+            get_delta_depth(
+                decompress(parent_block.content, parent_block.topics)
+            ) + 1
+            if parent_block.topics[0] == DELTA_BLOCK else 1
+        )
+        if depth >= self.keyframe_interval:
+            return content, update_topics
+        delta = encode_delta(
+            self.get_content_version(parent_id).content, content, depth
+        )
+        if len(delta) >= len(content):
+            return content, update_topics
+        return delta, [DELTA_BLOCK] + update_topics[1:]
+
+    def _needs_chunking(self, content: bytes | bytearray) -> bool:
+        return bool(self.chunk_size) and len(content) > self.chunk_size
+
+    def _encode_write(
+        self,
+        write: tuple[bytes | bytearray, list[str]],
+        codec: str | None = None,
+    ) -> tuple[bytes | bytearray, list[str]]:
+        """Chunk and compress the content of a base block to be created."""
+        return self._compress_write(self._chunk_write(write, codec), codec)
+
+    def _chunk_write(
+        self,
+        write: tuple[bytes | bytearray, list[str]],
+        codec: str | None = None,
+    ) -> tuple[bytes | bytearray, list[str]]:
+        """Store large content of a base block to be created in chunks.
+
+        Returns:
+            tuple: the content and topics of the base block to create,
+                for large content a manifest of the chunk blocks
+        """
+        content, topics = write
+        if not self._needs_chunking(content):
+            return write
+        view = memoryview(content)
+
+        def add_chunk(offset: int) -> tuple[int, bytes]:
+            # only copy the chunk once it's about to be stored
+            chunk = bytes(view[offset:offset + self.chunk_size])
+            block = self.base_blockchain.add_block(
+                *self._compress_write((chunk, [CHUNK_BLOCK]), codec)
+            )
+            return len(chunk), bytes(block.long_id)
+        with ThreadPoolExecutor(
+            max_workers=max(1, self.max_write_workers)
+        ) as executor:
+            chunks = list(executor.map(
+                add_chunk, range(0, len(content), self.chunk_size)
+            ))
+        return encode_manifest(chunks), topics + [CHUNKED_TOPIC]
+
+    def _compress_write(
+        self,
+        write: tuple[bytes | bytearray, list[str]],
+        codec: str | None = None,
+    ) -> tuple[bytes | bytearray, list[str]]:
+        """Compress the content of a base block to be created, if worthwhile.
+
+        Args:
+            write: the content and topics of the base block
+            codec: the codec to use instead of this MutaBlockchain's `codec`
+        """
+        content, topics = write
+        if codec is None:
+            codec = self.codec
+        if not codec or len(content) < self.compression_threshold:
+            return write
+        compressed, codec_topic = compress(content, codec)
+        if len(compressed) >= len(content):
+            return write
+        return compressed, topics + [codec_topic]
+
+    @staticmethod
+    def _get_deletion_topics(
+        parent_id: bytes | bytearray | ContentVersion
+    ) -> list[str]:
+        if isinstance(parent_id, ContentVersion):
+            parent_id = parent_id.cv_id
+        return [DELETION_BLOCK, bytes_to_string(parent_id)]
+
     # def get_block(self, id: bytearray | bytes) -> MutaBlock:
     #     return MutaBlock(self.base_blockchain.get_block(id), self)
 
@@ -102,32 +538,537 @@ class MutaBlockchain(BlockStore, GenericBlockchain):
         return self._blocks.get_block(bytes(block_id))
 
     def get_blocks(self, reverse: bool = False) -> list[MutaBlock]:
+        if self.exclude_deleted_blocks:
+            return self.get_live_blocks(reverse=reverse)
         return self._blocks.get_blocks(reverse=reverse)
 
     def get_block_ids(self) -> list[bytes]:
+        if self.exclude_deleted_blocks:
+            return self.get_live_block_ids()
         return self._blocks.get_long_ids()
 
+    def get_live_blocks(self, reverse: bool = False) -> list[MutaBlock]:
+        """Get the MutaBlocks which haven't been deleted."""
+        block_ids = self.get_live_block_ids()
+        if reverse:
+            block_ids.reverse()
+        return [self._blocks.get_block(block_id) for block_id in block_ids]
+
+    def get_live_block_ids(self) -> list[bytes]:
+        """Get the IDs of the MutaBlocks which haven't been deleted."""
+        return list(self._live_mutablock_ids)
+
+    def get_num_live_blocks(self) -> int:
+        """Get the number of MutaBlocks which haven't been deleted."""
+        return len(self._live_mutablock_ids)
+
+    def get_versions_between(
+        self, start: datetime | None = None, end: datetime | None = None
+    ) -> list[ContentVersion]:
+        """Get the ContentVersions of all MutaBlocks created in a time range.
+
+        Args:
+            start: the earliest timestamp to include, unbounded if None
+            end: the timestamp before which to stop, unbounded if None
+        Returns:
+            list[ContentVersion]: the ContentVersions, ordered by timestamp
+        """
+        return [
+            self.get_content_version(cv_id)
+            for cv_id in self.get_content_version_ids_between(start, end)
+        ]
+
+    def get_modified_blocks_since(self, time: datetime) -> list[MutaBlock]:
+        """Get the MutaBlocks created, edited or deleted since a given time.
+
+        Args:
+            time: the earliest ContentVersion timestamp to consider
+        Returns:
+            list[MutaBlock]: the MutaBlocks, ordered by the timestamp of
+                their first ContentVersion since `time`
+        """
+        mutablock_ids = dict.fromkeys(
+            self._verified_original_ids[cv_id]
+            for cv_id in self.get_content_version_ids_between(time)
+        )
+        return [
+            self.get_block(mutablock_id) for mutablock_id in mutablock_ids
+            if mutablock_id in self._blocks
+        ]
+
+    def snapshot_at(self, time: datetime) -> dict[bytes, ContentVersion]:
+        """Get the state of all MutaBlocks as of a given time.
+
+        Only the ContentVersion current at that time is decoded for each
+        MutaBlock, none of the versions before or after it.
+
+        Args:
+            time: the point in time to view the MutaBlockchain at
+        Returns:
+            dict[bytes, ContentVersion]: the ContentVersion current at `time`
+                of each MutaBlock that existed and wasn't deleted at `time`,
+                keyed by MutaBlock ID
+        """
+        state = {}
+        # including blocks deleted since
+        for mutablock_id in self._blocks.get_long_ids():
+            content_version = self.get_mutablock_version_at(mutablock_id, time)
+            if content_version and content_version.type != DELETION_BLOCK:
+                state[mutablock_id] = content_version
+        return state
+
+    def get_mutablock_version_at(
+        self, mutablock_id: bytearray | bytes, time: datetime
+    ) -> ContentVersion | None:
+        """Get the ContentVersion of a MutaBlock current at a given time."""
+        cv_id = self.get_mutablock_version_id_at(mutablock_id, time)
+        return self.get_content_version(cv_id) if cv_id else None
+
+    def find_blocks(
+        self,
+        topic: str | None = None,
+        creator_id: bytearray | bytes | None = None,
+    ) -> list[MutaBlock]:
+        """Get the MutaBlocks with the given topic and creator.
+
+        Uses indexes kept up to date as blocks are received, so no blocks
+        need to be loaded to evaluate the query.
+
+        Args:
+            topic: a user topic the MutaBlocks currently have, as of their
+                latest ContentVersion
+            creator_id: the ID of the creator of the MutaBlocks'
+                original blocks
+        Returns:
+            list[MutaBlock]: the matching MutaBlocks
+        """
+        return [
+            self.get_block(mutablock_id)
+            for mutablock_id in self.find_mutablock_ids(topic, creator_id)
+            if mutablock_id in self._blocks and not (
+                self.exclude_deleted_blocks
+                and self.is_mutablock_deleted(mutablock_id)
+            )
+        ]
+
     def get_num_blocks(self) -> int:
+        if self.exclude_deleted_blocks:
+            return self.get_num_live_blocks()
         return len(self._blocks)
 
+    def get_mutablock_head_id(self, mutablock_id: bytearray | bytes) -> bytes:
+        """Get the ID of the latest ContentVersion of a MutaBlock."""
+        return self._mutablock_versions[bytes(mutablock_id)][-1][1]
+
+    def get_mutablock_head(
+        self, mutablock_id: bytearray | bytes
+    ) -> ContentVersion:
+        """Get the latest ContentVersion of a MutaBlock."""
+        head = self._mutablock_heads.get(bytes(mutablock_id))
+        if head is None:  # stored before we were loaded
+            head_id = self.get_mutablock_head_id(mutablock_id)
+            head = self.get_content_version(head_id)
+            with self._db_lock:  # the index is updated while holding it
+                # unless a newer head was received in the meantime
+                if self.get_mutablock_head_id(mutablock_id) == head_id:
+                    self._set_mutablock_head(head)
+        return head
+
+    def _load_missed_blocks(self) -> None:
+        """Process the base blocks added since our last checkpoint.
+
+        The checkpoint is saved after each batch of blocks, so that an
+        interrupted catch-up resumes where it stopped.
+        """
+        block_ids = self.base_blockchain.get_block_ids()
+        n_processed, last_processed_id = self.get_checkpoint()
+        if not (
+            0 < n_processed <= len(block_ids)
+            and bytes(block_ids[n_processed - 1]) == last_processed_id
+        ):
+            # the base blockchain's block list doesn't match our checkpoint
+            n_processed = 0
+        logger.debug(
+            f"Loading {len(block_ids) - n_processed} missed base blocks..."
+        )
+        for start in range(n_processed, len(block_ids), INGESTION_BATCH_SIZE):
+            end = start + INGESTION_BATCH_SIZE
+            self.ingest_blocks(block_ids[start:end], notify=False)
+            self._save_checkpoint(block_ids[:end])
+
+    def ingest_blocks(
+        self,
+        blocks: list[GenericBlock | bytes | bytearray],
+        notify: bool = True,
+    ) -> int:
+        """Process many base blocks at once, e.g. to catch up with a chain.
+
+        The blocks are loaded and decoded concurrently, in levels ordered
+        by their parent references, so that each level's ancestry is
+        verified using the level before it.
+        The results are committed to the database once per
+        INGESTION_BATCH_SIZE blocks.
+
+        Args:
+            blocks: the base blocks or their IDs, in the base blockchain's
+                order; already processed blocks are skipped
+            notify: whether or not to pass the ingested blocks to the
+                `block_received_handler`
+        Returns:
+            int: the number of ContentVersions ingested
+        """
+        ingested = []
+        with ThreadPoolExecutor(
+            max_workers=max(1, self.max_sync_workers),
+            thread_name_prefix="MutaBlockchain-ingest",
+        ) as executor:
+            for start in range(0, len(blocks), INGESTION_BATCH_SIZE):
+                ingested += self._ingest_batch(
+                    blocks[start:start + INGESTION_BATCH_SIZE], executor
+                )
+        if notify:
+            self._notify(ingested)
+        return len(ingested)
+
+    def _ingest_batch(
+        self,
+        blocks: list[GenericBlock | bytes | bytearray],
+        executor: ThreadPoolExecutor,
+    ) -> list[GenericBlock]:
+        block_ids = [
+            bytes(block) for block in blocks
+            if isinstance(block, (bytes, bytearray))
+            and not self.is_content_version_known(block)
+        ]
+        loaded = dict(zip(
+            block_ids, executor.map(self.base_blockchain.get_block, block_ids)
+        ))
+        base_blocks = {}
+        for block in blocks:
+            if isinstance(block, (bytes, bytearray)):
+                block = loaded.get(bytes(block))
+            if block is None or self.is_content_version_known(block.long_id):
+                continue
+            topics = block.topics
+            if topics and topics[0] in BLOCK_TYPES and (
+                topics[0] == ORIGINAL_BLOCK or len(topics) >= 2
+            ):
+                base_blocks[bytes(block.long_id)] = block
+
+        # order the blocks into levels, each block's parent in an earlier one
+        children: dict[bytes, list[GenericBlock]] = {}
+        level = []
+        for block in base_blocks.values():
+            parent_id = (
+                bytes(string_to_bytes(block.topics[1]))
+                if block.topics[0] != ORIGINAL_BLOCK else b""
+            )
+            if parent_id in base_blocks:
+                children.setdefault(parent_id, []).append(block)
+            else:
+                level.append(block)
+            if block.topics[0] == ORIGINAL_BLOCK:
+                # register in chain order, decoding may finish in any order
+                self._blocks.add_block_id(block.long_id)
+
+        ingested = []
+        with self._receive_lock:
+            while level:
+                for block, content_version in zip(
+                    level, executor.map(self._decode_for_ingestion, level)
+                ):
+                    if content_version is None:
+                        continue
+                    self.add_content_version(content_version, commit=False)
+                    ingested.append(block)
+                    for orphan in self._orphans.pop(
+                        bytes(content_version.cv_id)
+                    ):
+                        ingested += self._process_block(orphan)
+                level = [
+                    child for block in level
+                    for child in children.get(bytes(block.long_id), [])
+                ]
+            self.commit_content_versions()
+        return ingested
+
+    def _decode_for_ingestion(
+        self, block: GenericBlock
+    ) -> ContentVersion | None:
+        try:
+            return self.decode_base_block(block)
+        except NotContentVersionBlockError:
+            return None
+        except BlockNotFoundError:
+            self._park_orphan(block)
+            return None
+        except CorruptContentAncestryError:
+            logger.warning(
+                "Skipping block with corrupt MutaBlock ancestry: "
+                f"{bytes(block.long_id).hex()}"
+            )
+            return None
+
+    def _save_checkpoint(self, block_ids: list[bytes] | None = None) -> None:
+        """Record that all of the base blockchain's blocks are processed."""
+        self.save_checkpoint(*self._get_processed_checkpoint(block_ids))
+
+    def _get_processed_checkpoint(
+        self, block_ids: list[bytes] | None = None
+    ) -> tuple[int, bytes]:
+        """Get a checkpoint covering the processed base blocks.
+
+        Blocks in the orphan buffer, or dropped from it, don't count as
+        processed, so that they are retried after a restart.
+
+        Args:
+            block_ids: the base blocks to consider, by default all of them
+        Returns:
+            tuple[int, bytes]: the number of leading blocks processed, and
+                the ID of the last of them
+        """
+        if block_ids is None:
+            block_ids = self.base_blockchain.get_block_ids()
+        n_processed = len(block_ids)
+        for block_id in list(self._dropped_orphan_ids):
+            if self.is_content_version_known(block_id):
+                self._dropped_orphan_ids.discard(block_id)
+        orphan_ids = set(self._orphans.get_block_ids())
+        orphan_ids.update(self._dropped_orphan_ids)
+        if orphan_ids:
+            n_processed = next(
+                index for index, block_id in enumerate(block_ids + [None])
+                if block_id is None or bytes(block_id) in orphan_ids
+            )
+        if not n_processed:
+            return 0, b""
+        return n_processed, bytes(block_ids[n_processed - 1])
+
+    def export_snapshot(self, path: str) -> None:
+        """Write the current state of all MutaBlocks to a snapshot file.
+
+        The snapshot contains the metadata of all ContentVersions and the
+        content of each MutaBlock's current head.
+        Load it with `load_snapshot` or the `snapshot_path` constructor
+        parameter to bootstrap another MutaBlockchain on the same base
+        blockchain without decoding all its blocks.
+
+        Args:
+            path: the path of the snapshot file to create or overwrite
+        """
+        with self._receive_lock:
+            head_ids = {
+                versions[-1][1]
+                for versions in self._mutablock_versions.values()
+            }
+            if self.auto_load_missed_blocks:
+                checkpoint = self._get_processed_checkpoint()
+            else:
+                checkpoint = self.get_checkpoint()
+            records = [
+                SnapshotRecord(
+                    type=type,
+                    cv_id=cv_id,
+                    parent_id=parent_id,
+                    original_id=original_id,
+                    timestamp=timestamp,
+                    topics=topics,
+                    creator_id=creator_id,
+                )
+                for (
+                    cv_id, type, parent_id, original_id, timestamp, topics,
+                    creator_id
+                ) in self.get_stored_content_versions()
+            ]
+
+        def get_head_content(record: SnapshotRecord) -> bytes | None:
+            if record.cv_id not in head_ids:
+                return None
+            head = self._mutablock_heads.get(record.original_id)
+            if (
+                head is not None and bytes(head.cv_id) == record.cv_id
+                and head.is_content_loaded
+            ):
+                return head.content
+            return self.load_content(record.cv_id)
+        write_snapshot(path, records, get_head_content, *checkpoint)
+
+    def load_snapshot(self, path: str) -> None:
+        """Load the state of all MutaBlocks from a snapshot file.
+
+        The snapshot file stays memory-mapped, serving the content of the
+        MutaBlocks' heads from it. Afterwards, only the base blocks added
+        since the snapshot was created are processed.
+
+        Args:
+            path: the path of a snapshot file created with `export_snapshot`
+        """
+        self._import_snapshot(path)
+        if self.auto_load_missed_blocks:
+            self._load_missed_blocks()
+
+    def _import_snapshot(self, path: str) -> None:
+        snapshot = MappedSnapshot(path)
+        self._snapshots.append(snapshot)
+        with self._receive_lock:
+            for record in snapshot.get_records():
+                if self.is_content_version_known(record.cv_id):
+                    continue
+                if record.has_content:
+                    self._snapshot_contents[record.cv_id] = partial(
+                        snapshot.get_content, record
+                    )
+                content_version = ContentVersion(
+                    type=record.type,
+                    cv_id=record.cv_id,
+                    parent_id=record.parent_id,
+                    original_id=record.original_id,
+                    content=None,
+                    timestamp=record.timestamp,
+                    topics=record.topics,
+                    content_loader=partial(self.load_content, record.cv_id),
+                    creator_id=record.creator_id,
+                    loaded_size_handler=self._on_loaded_size_changed,
+                )
+                self._verified_original_ids[record.cv_id] = record.original_id
+                self.add_content_version(content_version, commit=False)
+                if record.type == ORIGINAL_BLOCK:
+                    self._blocks.add_block_id(record.cv_id)
+            self.commit_content_versions()
+            if self.get_checkpoint()[0] < snapshot.n_processed_blocks:
+                self.save_checkpoint(
+                    snapshot.n_processed_blocks, snapshot.last_processed_block
+                )
+
+    def load_content(self, content_version_id: bytearray | bytes) -> bytes:
+        """Load a ContentVersion's content, from a snapshot if it has it."""
+        load_snapshot_content = self._snapshot_contents.get(
+            bytes(content_version_id)
+        )
+        if load_snapshot_content:
+            return load_snapshot_content()
+        return BlockStore.load_content(self, content_version_id)
+
     def _on_block_received(self, block: walytis_beta_api.Block) -> None:  # pylint: disable=no-self-argument
         logger.debug("OBR: Received block!")
-        block_id = bytes_to_string(block.long_id)  # pylint: disable=no-member
-        logger.debug("OBR: Checking known blocks...")
-        if block_id in self.get_content_block_ids():
-            logger.debug("OBR: We already have that block")
+        with self._receive_lock:
+            processed = self._process_block(block)
+            logger.debug("OBR: Finished processing received block.")
+            if self._is_in_batch():
+                self._batch.notifications.extend(processed)
+                return
+        self._notify(processed)
+
+    def _notify(self, blocks: list[GenericBlock]) -> None:
+        """Pass processed blocks to the block_received_handler."""
+        if not self.block_received_handler:
             return
-        logger.debug("OBR: loading block details...")
-        try:
-            content_version = self.decode_base_block(block)
-        except NotContentVersionBlockError:
+        if self._coalescer:
+            for block in blocks:
+                self._coalescer.add(
+                    self._verified_original_ids[bytes(block.long_id)], block
+                )
             return
-        self.add_content_version(content_version)
+        for block in blocks:
+            self.block_received_handler(ReceivedBlock(
+                block, self.get_content_version(block.long_id)
+            ))
 
-        logger.debug("OBR: Finished processing received block.")
+    def _deliver_coalesced(self, block: CoalescedBlock) -> None:
         if self.block_received_handler:
             self.block_received_handler(block)
 
+    def _get_receive_shard_key(self, block: GenericBlock) -> bytes:
+        """Get the ID of the MutaBlock a block belongs to.
+
+        Resolved from the topics of the block's ancestors, so it's known
+        even while its parent is still waiting to be processed.
+        """
+        topics = block.topics
+        if len(topics) >= 2 and topics[0] in BLOCK_TYPES - {ORIGINAL_BLOCK}:
+            parent_id = bytes(string_to_bytes(topics[1]))
+            try:
+                return self.get_verified_original_id(parent_id)
+            except (BlockNotFoundError, CorruptContentAncestryError):
+                # processing parks or rejects it, whichever worker does it
+                return parent_id
+        return bytes(block.long_id)
+
+    def flush(self) -> None:
+        """Wait until all blocks received so far have been processed.
+
+        With coalesced notifications, also delivers pending notifications.
+        """
+        if self._receive_pipeline:
+            self._receive_pipeline.flush()
+        if self._coalescer:
+            self._coalescer.flush()
+
+    def _process_block(self, block: GenericBlock) -> list[GenericBlock]:
+        """Decode and store a base block, and any orphans waiting for it.
+
+        Blocks whose ancestry can't be verified yet because a parent block
+        is missing are parked in the orphan buffer.
+
+        Returns:
+            list[GenericBlock]: the blocks that were stored
+        """
+        processed = []
+        pending = deque([block])
+        while pending:
+            block = pending.popleft()
+            if self.is_content_version_known(block.long_id):
+                logger.debug("OBR: We already have that block")
+                continue
+            try:
+                content_version = self.decode_base_block(block)
+            except NotContentVersionBlockError:
+                continue
+            except BlockNotFoundError:
+                self._park_orphan(block)
+                continue
+            except CorruptContentAncestryError:
+                logger.warning(
+                    "Skipping block with corrupt MutaBlock ancestry: "
+                    f"{bytes(block.long_id).hex()}"
+                )
+                # its descendants are corrupt too
+                pending += self._orphans.pop(bytes(block.long_id))
+                continue
+            self.add_content_version(
+                content_version, commit=not self._is_in_batch()
+            )
+            # new heads are kept in _mutablock_heads
+            if self._mutablock_heads.get(
+                bytes(content_version.original_id)
+            ) is not content_version:
+                self._content_version_cache.put(
+                    bytes(content_version.cv_id), content_version
+                )
+            processed.append(block)
+            pending += self._orphans.pop(bytes(content_version.cv_id))
+        return processed
+
+    def _park_orphan(self, block: GenericBlock) -> None:
+        logger.debug("OBR: Parent block missing, parking block.")
+        parent_id = bytes(string_to_bytes(block.topics[1]))
+        self._orphans.park(parent_id, bytes(block.long_id), block)
+
+    def _on_orphan_dropped(self, block_id: bytes, block: GenericBlock) -> None:
+        logger.warning(
+            "Dropping block whose parent didn't arrive, it will be processed "
+            f"on the next startup: {block_id.hex()}"
+        )
+        self._dropped_orphan_ids.add(block_id)
+
+    def get_orphan_stats(self) -> dict:
+        """Get statistics about blocks received before their parents.
+
+        Returns:
+            dict: see `OrphanBuffer.get_stats`
+        """
+        return self._orphans.get_stats()
+
     def decode_base_block(self, block: Block) -> ContentVersion:
         timestamp = block.creation_time
 
@@ -138,25 +1079,41 @@ class MutaBlockchain(BlockStore, GenericBlockchain):
             parent_id = bytearray()
             original_id = block.long_id
             user_topics = block.topics[1:]
+            self._verified_original_ids[bytes(original_id)] = bytes(
+                original_id
+            )
             self._blocks.add_block(MutaBlock(block, self))
         elif len(block.topics) >= 2 and block.topics[0] in {
             UPDATE_BLOCK,
             DELETION_BLOCK,
+            DELTA_BLOCK,
         }:
             parent_id = string_to_bytes(block.topics[1])
-            original_id = self.verify_original(parent_id).cv_id
+            original_id = self.get_verified_original_id(parent_id)
+            self._verified_original_ids[bytes(block.long_id)] = original_id
             user_topics = block.topics[2:]
         else:
             raise NotContentVersionBlockError()
+        user_topics = [
+            topic for topic in user_topics
+            if not is_codec_topic(topic) and topic != CHUNKED_TOPIC
+        ]
         # logger.debug("OBR: Adding mutablock...")
         return ContentVersion(
-            type=block.topics[0],
+            # deltas are an encoding detail, readers see plain updates
+            type=(
+                UPDATE_BLOCK if block.topics[0] == DELTA_BLOCK
+                else block.topics[0]
+            ),
             cv_id=block.long_id,
             parent_id=parent_id,
             original_id=original_id,
-            content=block.content,
+            content=None,
             timestamp=timestamp,
             topics=user_topics,
+            content_loader=partial(self.load_content, bytes(block.long_id)),
+            creator_id=block.creator_id,
+            loaded_size_handler=self._on_loaded_size_changed,
         )
 
     def get_peers(self) -> list[str]:
@@ -170,6 +1127,27 @@ class MutaBlockchain(BlockStore, GenericBlockchain):
         self.base_blockchain.delete()
 
     def terminate(self, **kwargs) -> None:
+        receive_pipeline = getattr(self, "_receive_pipeline", None)
+        if receive_pipeline:
+            self._receive_pipeline = None
+            # process anything still arriving inline until we're terminated
+            self.base_blockchain.block_received_handler = (
+                self._on_block_received
+            )
+            receive_pipeline.stop()
+        coalescer = getattr(self, "_coalescer", None)
+        if coalescer:
+            self._coalescer = None
+            coalescer.stop()
+        # if we didn't load missed blocks, not all base blocks are processed
+        if self.db and self.auto_load_missed_blocks:
+            try:
+                self._save_checkpoint()
+            except Exception as error:
+                logger.warning(f"Failed to save checkpoint: {error}")
+        BlockStore.terminate(self)
+        for snapshot in self._snapshots:
+            snapshot.close()
         self.base_blockchain.terminate(**kwargs)
 
     def __del__(self) -> None:
@@ -180,4 +1158,8 @@ class NotContentVersionBlockError(Exception):
     pass
 
 
-decorate_all_functions(strictly_typed, __name__)
+class ReservedTopicError(Exception):
+    pass
+
+
+apply_strict_typing(__name__)
@@ -0,0 +1,200 @@
+"""Block-received notifications, and their coalescing per MutaBlock."""
+from threading import Condition, Thread
+from time import monotonic
+from typing import Callable
+
+from walytis_beta_api._experimental.generic_blockchain import GenericBlock
+
+from .chunking import CHUNKED_TOPIC
+from .compression import is_codec_topic
+from .mutablock import ContentVersion
+from .utils import apply_strict_typing, logger
+
+
+class ReceivedBlock(GenericBlock):
+    """A received base block, as passed to the `block_received_handler`.
+
+    Behaves like the base block, except that its content is the decoded
+    content of its ContentVersion, and its topics leave out the markers of
+    how the content is encoded, so that a delta update looks like a plain
+    update, and compressed or chunked content like uncompressed content.
+    """
+
+    def __init__(
+        self, base_block: GenericBlock, content_version: ContentVersion
+    ):
+        self.base_block = base_block
+        self.content_version = content_version
+
+    @property
+    def ipfs_cid(self):
+        return self.base_block.ipfs_cid
+
+    @property
+    def short_id(self):
+        return self.base_block.short_id
+
+    @property
+    def long_id(self):
+        return self.base_block.long_id
+
+    @property
+    def creator_id(self):
+        return self.base_block.creator_id
+
+    @property
+    def creation_time(self):
+        return self.base_block.creation_time
+
+    @property
+    def topics(self):
+        return [self.content_version.type] + [
+            topic for topic in self.base_block.topics[1:]
+            if not is_codec_topic(topic) and topic != CHUNKED_TOPIC
+        ]
+
+    @property
+    def content(self):
+        return self.content_version.content
+
+    @property
+    def parents(self):
+        return self.base_block.parents
+
+    @property
+    def file_data(self):
+        return self.base_block.file_data
+
+
+class CoalescedBlock(ReceivedBlock):
+    """The new head of a MutaBlock of which several blocks were received.
+
+    Behaves like a ReceivedBlock of the head's base block, additionally
+    listing the IDs of the other ContentVersions received with it, which
+    it supersedes.
+    """
+
+    def __init__(
+        self,
+        base_block: GenericBlock,
+        content_version: ContentVersion,
+        mutablock_id: bytes,
+        intermediate_version_ids: list[bytes],
+    ):
+        ReceivedBlock.__init__(self, base_block, content_version)
+        self.mutablock_id = mutablock_id
+        self.intermediate_version_ids = intermediate_version_ids
+
+
+class NotificationCoalescer:
+    """Groups notifications per MutaBlock, delivering one per group.
+
+    A MutaBlock's group is delivered `window` seconds after its first
+    notification, or as soon as it holds `max_versions` blocks.
+    A group is delivered as its MutaBlock's current head. Groups that don't
+    contain the head, e.g. old versions received late, are skipped, as
+    they don't change the MutaBlock's state.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[CoalescedBlock], None],
+        get_head: Callable[[bytes], ContentVersion],
+        window: float,
+        max_versions: int = 100,
+    ):
+        """Start the timer thread.
+
+        Args:
+            deliver: function to call with each group's CoalescedBlock
+            get_head: function getting a MutaBlock's current head
+                ContentVersion given the MutaBlock's ID
+            window: how many seconds to collect a group's notifications
+            max_versions: the number of blocks after which a group is
+                delivered without waiting for its window to end
+        """
+        self._deliver = deliver
+        self._get_head = get_head
+        self.window = window
+        self.max_versions = max_versions
+        # MutaBlock ID: (delivery deadline, blocks), in order of deadline
+        self._groups: dict[bytes, tuple[float, list[GenericBlock]]] = {}
+        self._condition = Condition()
+        self._stopped = False
+        self._thread = Thread(
+            target=self._run, name="NotificationCoalescer", daemon=True
+        )
+        self._thread.start()
+
+    def add(self, mutablock_id: bytes, block: GenericBlock) -> None:
+        """Add a notification about a block of the given MutaBlock."""
+        with self._condition:
+            if mutablock_id not in self._groups:
+                self._groups[mutablock_id] = (monotonic() + self.window, [])
+                self._condition.notify()
+            blocks = self._groups[mutablock_id][1]
+            blocks.append(block)
+            if len(blocks) < self.max_versions:
+                return
+            del self._groups[mutablock_id]
+        self._deliver_group(mutablock_id, blocks)
+
+    def _deliver_group(
+        self, mutablock_id: bytes, blocks: list[GenericBlock]
+    ) -> None:
+        try:
+            head = self._get_head(mutablock_id)
+            head_block = next((
+                block for block in blocks
+                if bytes(block.long_id) == bytes(head.cv_id)
+            ), None)
+            if head_block is None:
+                return
+            self._deliver(CoalescedBlock(
+                head_block,
+                head,
+                mutablock_id,
+                [
+                    bytes(block.long_id) for block in blocks
+                    if block is not head_block
+                ],
+            ))
+        except Exception:
+            logger.exception("NotificationCoalescer: handler failed")
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._stopped and not self._groups:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                # groups are created in order of their deadlines
+                mutablock_id, (deadline, blocks) = next(
+                    iter(self._groups.items())
+                )
+                delay = deadline - monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                del self._groups[mutablock_id]
+            self._deliver_group(mutablock_id, blocks)
+
+    def flush(self) -> None:
+        """Deliver all pending notifications now."""
+        with self._condition:
+            groups = self._groups
+            self._groups = {}
+        for mutablock_id, (_, blocks) in groups.items():
+            self._deliver_group(mutablock_id, blocks)
+
+    def stop(self) -> None:
+        """Deliver all pending notifications and stop the timer thread."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+
+apply_strict_typing(__name__)
@@ -0,0 +1,151 @@
+"""A buffer for blocks received before the blocks they depend on."""
+from collections import deque
+from threading import Lock
+from time import monotonic
+from typing import Callable, Generic, TypeVar
+
+from .utils import apply_strict_typing
+
+B = TypeVar("B")
+
+
+class OrphanBuffer(Generic[B]):
+    """Thread-safe store of orphan blocks, keyed by their missing parent.
+
+    Orphans are released as soon as their parent is processed.
+    The buffer holds at most `max_size` orphans, evicting the oldest when
+    full, and drops orphans whose parent hasn't arrived within `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl: float = 600.0,
+        on_drop: Callable[[bytes, B], None] | None = None,
+    ):
+        """Create an empty buffer.
+
+        Args:
+            max_size: the maximum number of orphans to hold
+            ttl: how many seconds an orphan may wait for its parent
+            on_drop: function to call with the ID and block of every orphan
+                that expires or gets evicted
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_drop = on_drop
+        # parent ID: {orphan block ID: (arrival time, orphan block)}
+        self._orphans: dict[bytes, dict[bytes, tuple[float, B]]] = {}
+        # (arrival time, parent ID, orphan block ID), oldest first;
+        # entries of orphans already released are skipped when popped
+        self._arrivals: deque[tuple[float, bytes, bytes]] = deque()
+        self._size = 0
+        self._lock = Lock()
+        self.parked = 0
+        self.resolved = 0
+        self.expired = 0
+        self.evicted = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def park(self, parent_id: bytes, block_id: bytes, block: B) -> None:
+        """Store an orphan until its parent is processed."""
+        now = monotonic()
+        with self._lock:
+            dropped = self._expire(now)
+            orphans = self._orphans.setdefault(parent_id, {})
+            if block_id not in orphans:
+                orphans[block_id] = (now, block)
+                self._arrivals.append((now, parent_id, block_id))
+                self._size += 1
+                self.parked += 1
+            while self._size > self.max_size:
+                orphan = self._drop_oldest()
+                if orphan:
+                    self.evicted += 1
+                    dropped.append(orphan)
+        self._notify_dropped(dropped)
+
+    def pop(self, parent_id: bytes) -> list[B]:
+        """Release the orphans waiting for the given parent."""
+        with self._lock:
+            orphans = self._orphans.pop(parent_id, None)
+            if not orphans:
+                return []
+            now = monotonic()
+            self._size -= len(orphans)
+            self.resolved += len(orphans)
+            for arrival, _ in orphans.values():
+                wait = now - arrival
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            return [block for _, block in orphans.values()]
+
+    def get_block_ids(self) -> list[bytes]:
+        """Get the IDs of the orphans currently waiting for their parents."""
+        with self._lock:
+            dropped = self._expire(monotonic())
+            block_ids = [
+                block_id
+                for orphans in self._orphans.values()
+                for block_id in orphans
+            ]
+        self._notify_dropped(dropped)
+        return block_ids
+
+    def _expire(self, now: float) -> list[tuple[bytes, B]]:
+        """Drop the orphans that have waited too long, returning them."""
+        dropped = []
+        while self._arrivals and self._arrivals[0][0] + self.ttl < now:
+            orphan = self._drop_oldest()
+            if orphan:
+                self.expired += 1
+                dropped.append(orphan)
+        return dropped
+
+    def _drop_oldest(self) -> tuple[bytes, B] | None:
+        """Drop the oldest orphan, returning None if it was released."""
+        arrival, parent_id, block_id = self._arrivals.popleft()
+        orphans = self._orphans.get(parent_id)
+        if not orphans or orphans.get(block_id, (None,))[0] != arrival:
+            return None
+        _, block = orphans.pop(block_id)
+        if not orphans:
+            del self._orphans[parent_id]
+        self._size -= 1
+        return block_id, block
+
+    def _notify_dropped(self, dropped: list[tuple[bytes, B]]) -> None:
+        if self.on_drop:
+            for block_id, block in dropped:
+                self.on_drop(block_id, block)
+
+    def get_stats(self) -> dict:
+        """Get the buffer's usage statistics.
+
+        Returns:
+            dict: the number of `pending` orphans, how many were `parked`,
+                `resolved`, `expired` and `evicted`, and the average and
+                maximum time resolved orphans waited, in seconds
+        """
+        with self._lock:
+            dropped = self._expire(monotonic())
+            stats = {
+                "pending": self._size,
+                "parked": self.parked,
+                "resolved": self.resolved,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "mean_wait_s": (
+                    self._total_wait / self.resolved if self.resolved else 0.0
+                ),
+                "max_wait_s": self._max_wait,
+            }
+        self._notify_dropped(dropped)
+        return stats
+
+    def __len__(self) -> int:
+        return self._size
+
+
+apply_strict_typing(__name__)
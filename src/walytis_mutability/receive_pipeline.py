@@ -0,0 +1,93 @@
+"""Asynchronous processing of received blocks on worker threads."""
+from queue import Queue
+from threading import Thread
+from typing import Callable, Generic, Hashable, TypeVar
+
+from .utils import apply_strict_typing, logger
+
+B = TypeVar("B")
+
+_STOP = object()  # queued to make a worker exit
+
+
+class ReceivePipeline(Generic[B]):
+    """Passes items to a processing function on worker threads.
+
+    Each worker has its own bounded queue. Items with the same shard key
+    always go to the same worker, so they are processed in the order they
+    were submitted, while items with different keys are processed in
+    parallel. When a worker's queue is full, `submit` blocks until there is
+    space, slowing the producer down rather than buffering without limit.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[B], None],
+        n_workers: int = 1,
+        queue_size: int = 1024,
+        get_shard_key: Callable[[B], Hashable] | None = None,
+        name: str = "ReceivePipeline",
+    ):
+        """Start the worker threads.
+
+        Args:
+            process: the function to call on each item
+            n_workers: the number of worker threads
+            queue_size: how many items may be waiting for each worker
+            get_shard_key: function getting the key that determines which
+                worker processes an item, if None, all items go to the
+                first worker
+            name: the prefix of the worker threads' names
+        """
+        self._process = process
+        self._get_shard_key = get_shard_key
+        self._queues: list[Queue] = [
+            Queue(maxsize=queue_size) for _ in range(max(1, n_workers))
+        ]
+        self._workers = [
+            Thread(target=self._run, args=(queue,), name=f"{name}-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    def submit(self, item: B) -> None:
+        """Queue an item for processing, blocking while the queue is full."""
+        if self._get_shard_key is None or len(self._queues) == 1:
+            queue = self._queues[0]
+        else:
+            key = self._get_shard_key(item)
+            queue = self._queues[hash(key) % len(self._queues)]
+        queue.put(item)
+
+    def _run(self, queue: Queue) -> None:
+        while True:
+            item = queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self._process(item)
+            except Exception:
+                logger.exception("ReceivePipeline: failed to process item")
+            finally:
+                queue.task_done()
+
+    def get_queue_lengths(self) -> list[int]:
+        """Get the number of items waiting for each worker."""
+        return [queue.qsize() for queue in self._queues]
+
+    def flush(self) -> None:
+        """Wait until all items submitted so far have been processed."""
+        for queue in self._queues:
+            queue.join()
+
+    def stop(self) -> None:
+        """Process the remaining items, then stop the worker threads."""
+        for queue in self._queues:
+            queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+
+apply_strict_typing(__name__)
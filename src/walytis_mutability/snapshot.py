@@ -0,0 +1,188 @@
+"""Compact binary snapshots of a MutaBlockchain's materialised state.
+
+A snapshot file contains the metadata of every ContentVersion and the
+content of every MutaBlock's current head, so that a fresh MutaBlockchain
+can be bootstrapped without decoding the whole base blockchain.
+Snapshots are memory-mapped read-only, so head content is served from the
+file without loading it all into memory.
+
+File layout (little-endian):
+    header:  magic, index offset, number of processed base blocks,
+             length of the last processed base block's ID, that ID
+    content: the head contents, concatenated
+    index:   number of records, then one record per ContentVersion:
+             type, timestamp, content offset & length, lengths of the
+             ContentVersion, parent, original and creator IDs and the
+             topics, followed by those IDs and the JSON-encoded topics
+"""
+import json
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable
+
+from .mutablock import DELETION_BLOCK, ORIGINAL_BLOCK, UPDATE_BLOCK
+from .utils import apply_strict_typing
+
+MAGIC = b"WMSNAP02"
+HEADER = struct.Struct("<8sQQH")
+INDEX_HEADER = struct.Struct("<Q")
+RECORD = struct.Struct("<BqQQHHHHI")
+NO_CONTENT = 2**64 - 1  # content offset of records without content
+
+BLOCK_TYPE_CODES = [ORIGINAL_BLOCK, UPDATE_BLOCK, DELETION_BLOCK]
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+@dataclass
+class SnapshotRecord:
+    """The metadata of a ContentVersion stored in a snapshot."""
+
+    type: str
+    cv_id: bytes
+    parent_id: bytes
+    original_id: bytes
+    timestamp: datetime
+    topics: list[str]
+    creator_id: bytes = b""
+    content_offset: int = NO_CONTENT
+    content_length: int = 0
+
+    @property
+    def has_content(self) -> bool:
+        return self.content_offset != NO_CONTENT
+
+
+def write_snapshot(
+    path: str,
+    records: Iterable[SnapshotRecord],
+    get_content: Callable[[SnapshotRecord], bytes | bytearray | None],
+    n_processed_blocks: int,
+    last_processed_block: bytes | bytearray,
+) -> None:
+    """Write a snapshot file.
+
+    Args:
+        path: the path of the snapshot file to create or overwrite
+        records: the metadata of all ContentVersions
+        get_content: function returning the content to store for a
+            record, or None if its content shouldn't be stored
+        n_processed_blocks: the number of base blocks the snapshot covers
+        last_processed_block: the ID of the last of those base blocks
+    """
+    temp_path = path + ".tmp"
+    last_processed_block = bytes(last_processed_block)
+    index = bytearray()
+    n_records = 0
+    with open(temp_path, "wb") as file:
+        # header is rewritten once the index offset is known
+        file.write(HEADER.pack(MAGIC, 0, 0, 0) + last_processed_block)
+        for record in records:
+            content = get_content(record)
+            if content is not None:
+                record.content_offset = file.tell()
+                record.content_length = len(content)
+                file.write(content)
+            topics = json.dumps(record.topics).encode()
+            index += RECORD.pack(
+                BLOCK_TYPE_CODES.index(record.type),
+                (record.timestamp - EPOCH) // timedelta(microseconds=1),
+                record.content_offset,
+                record.content_length,
+                len(record.cv_id),
+                len(record.parent_id),
+                len(record.original_id),
+                len(record.creator_id),
+                len(topics),
+            )
+            index += (
+                bytes(record.cv_id) + bytes(record.parent_id)
+                + bytes(record.original_id) + bytes(record.creator_id)
+                + topics
+            )
+            n_records += 1
+        index_offset = file.tell()
+        file.write(INDEX_HEADER.pack(n_records))
+        file.write(index)
+        file.seek(0)
+        file.write(HEADER.pack(
+            MAGIC, index_offset, n_processed_blocks, len(last_processed_block)
+        ))
+    os.replace(temp_path, path)
+
+
+class MappedSnapshot:
+    """A read-only, memory-mapped snapshot file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, n_processed_blocks, len_last_id = (
+            HEADER.unpack_from(self._mmap, 0)
+        )
+        if magic != MAGIC:
+            self.close()
+            raise InvalidSnapshotError(
+                f"Not a MutaBlockchain snapshot: {path}"
+            )
+        self.n_processed_blocks = n_processed_blocks
+        self.last_processed_block = bytes(
+            self._mmap[HEADER.size:HEADER.size + len_last_id]
+        )
+        self._index_offset = index_offset
+
+    def get_records(self) -> Iterable[SnapshotRecord]:
+        """Iterate over the metadata of all ContentVersions."""
+        mm = self._mmap
+        (n_records,) = INDEX_HEADER.unpack_from(mm, self._index_offset)
+        position = self._index_offset + INDEX_HEADER.size
+        for _ in range(n_records):
+            (
+                type_code, timestamp, content_offset, content_length,
+                len_cv_id, len_parent_id, len_original_id, len_creator_id,
+                len_topics
+            ) = RECORD.unpack_from(mm, position)
+            position += RECORD.size
+            cv_id = mm[position:position + len_cv_id]
+            position += len_cv_id
+            parent_id = mm[position:position + len_parent_id]
+            position += len_parent_id
+            original_id = mm[position:position + len_original_id]
+            position += len_original_id
+            creator_id = mm[position:position + len_creator_id]
+            position += len_creator_id
+            topics = json.loads(mm[position:position + len_topics])
+            position += len_topics
+            yield SnapshotRecord(
+                type=BLOCK_TYPE_CODES[type_code],
+                cv_id=cv_id,
+                parent_id=parent_id,
+                original_id=original_id,
+                timestamp=EPOCH + timedelta(microseconds=timestamp),
+                topics=topics,
+                creator_id=creator_id,
+                content_offset=content_offset,
+                content_length=content_length,
+            )
+
+    def get_content(self, record: SnapshotRecord) -> bytes:
+        """Read a record's content from the mapped file."""
+        if not record.has_content:
+            raise ValueError("This snapshot record has no content.")
+        return self._mmap[
+            record.content_offset:record.content_offset + record.content_length
+        ]
+
+    def close(self) -> None:
+        if not self._mmap.closed:
+            self._mmap.close()
+
+
+class InvalidSnapshotError(Exception):
+    pass
+
+
+apply_strict_typing(__name__)
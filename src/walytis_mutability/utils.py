@@ -1 +1,28 @@
 from .log import logger_walymut as logger
+import os
+from decorate_all import decorate_all_functions
+from strict_typing import strictly_typed
+
+
+def _read_production_mode() -> bool:
+    """Check if the environment enables production mode."""
+    return os.environ.get(
+        "WALYTIS_MUTABILITY_PRODUCTION", ""
+    ).lower() in ("1", "true", "yes")
+
+
+# Set the environment variable WALYTIS_MUTABILITY_PRODUCTION to "true"
+# before importing this package to skip runtime type checking.
+PRODUCTION_MODE = _read_production_mode()
+
+
+def apply_strict_typing(module_name: str) -> None:
+    """Add runtime type checks to a module's functions.
+
+    Only the module-level functions are checked, including the ones the
+    module imports, such as `bytes_to_string`. Methods aren't checked, so
+    production mode only saves the checks on those functions' calls.
+    Does nothing in production mode.
+    """
+    if not PRODUCTION_MODE:
+        decorate_all_functions(strictly_typed, module_name)
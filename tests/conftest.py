@@ -61,6 +61,8 @@ if True:
         "WALYTIS_BETA_API_TYPE", "WALYTIS_BETA_BRENTHY_API", override=False
     )
 
+    # keep runtime type checking enabled in tests
+    set_env_var("WALYTIS_MUTABILITY_PRODUCTION", "false", override=True)
     set_env_var(
         "WALYTIS_BETA_LOG_PATH",
         os.path.join(os.getcwd(), "Walytis.log"),
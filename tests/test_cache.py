@@ -0,0 +1,68 @@
+import _auto_run_with_pytest
+
+from walytis_mutability.cache import LRUCache
+
+
+def test_entry_limit():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1, "Cached value"
+    cache.put("c", 3)
+    assert "b" not in cache and "a" in cache and "c" in cache, "Least recently used entry evicted"
+    assert len(cache) == 2, "Entry limit"
+
+
+def test_byte_limit():
+    cache = LRUCache(max_entries=0, max_bytes=10, get_size=len)
+    cache.put("a", b"1234")
+    cache.put("b", b"5678")
+    cache.put("c", b"9012")
+    assert "a" not in cache and cache.get_stats()["bytes"] == 8, "Byte limit"
+    cache.put("b", b"1")
+    assert cache.get_stats()["bytes"] == 5, "Size of replaced value"
+    cache.put("d", b"12345678901234")
+    assert len(cache) == 1 and "d" in cache, "Oversized value kept alone"
+
+
+def test_refresh_size():
+    cache = LRUCache(max_entries=0, max_bytes=10, get_size=len)
+    value = bytearray(b"12")
+    cache.put("a", b"34")
+    cache.put("b", value)
+    value.extend(b"3456789")
+    cache.refresh_size("b")
+    assert "a" not in cache and cache.get_stats()["bytes"] == 9, "Refreshed size"
+
+
+def test_on_evict():
+    evicted = []
+    cache = LRUCache(
+        max_entries=1, on_evict=lambda key, value: evicted.append((key, value))
+    )
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.remove("b")
+    assert evicted == [("a", 1)], "Eviction callback"
+    assert len(cache) == 0, "Removed entry"
+
+
+def test_stats():
+    cache = LRUCache(max_entries=1, max_bytes=100, get_size=len)
+    cache.put("a", b"12")
+    cache.get("a")
+    cache.get("b")
+    cache.put("b", b"345")
+    assert cache.get_stats() == {
+        "entries": 1, "bytes": 3, "hits": 1, "misses": 1, "evictions": 1
+    }, "Cache statistics"
+    cache.clear()
+    assert cache.get_stats()["entries"] == cache.get_stats()["bytes"] == 0, "Cleared cache"
+
+
+def run_tests():
+    test_entry_limit()
+    test_byte_limit()
+    test_refresh_size()
+    test_on_evict()
+    test_stats()
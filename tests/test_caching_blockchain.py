@@ -0,0 +1,63 @@
+import _auto_run_with_pytest
+
+import time
+
+from brenthy_tools_beta.utils import bytes_to_string
+
+from walytis_mutability.caching_blockchain import CachingBlockchain
+from walytis_mutability.memory_blockchain import MemoryBlockchain
+from walytis_mutability.mutablock import ORIGINAL_BLOCK, UPDATE_BLOCK
+
+
+class CountingBlockchain(MemoryBlockchain):
+    """A MemoryBlockchain that counts the blocks retrieved from it."""
+
+    def __init__(self):
+        MemoryBlockchain.__init__(self)
+        self.retrieved: list[bytes] = []
+
+    def get_block(self, id):
+        self.retrieved.append(bytes(id))
+        return MemoryBlockchain.get_block(self, id)
+
+
+def test_prefetch_parent():
+    base_blockchain = CountingBlockchain()
+    block = base_blockchain.add_block("Version 0".encode(), ORIGINAL_BLOCK)
+    block_ids = [bytes(block.long_id)]
+    for i in range(1, 200):
+        block = base_blockchain.add_block(
+            f"Version {i}".encode(),
+            [UPDATE_BLOCK, bytes_to_string(block.long_id)],
+        )
+        block_ids.append(bytes(block.long_id))
+    caching = CachingBlockchain(base_blockchain)
+    try:
+        caching.get_block(block_ids[-1])
+        time.sleep(0.5)  # give the background prefetching time to run
+        assert base_blockchain.retrieved == block_ids[:-3:-1], "Only the parent prefetched"
+        assert caching.get_cache_stats()["entries"] == 2, "Prefetched parent cached"
+    finally:
+        caching.terminate()
+
+
+def test_byte_limit():
+    base_blockchain = MemoryBlockchain()
+    block_ids = [
+        base_blockchain.add_block(bytes(400)).long_id for _ in range(5)
+    ]
+    caching = CachingBlockchain(
+        base_blockchain, max_bytes=1000, prefetch_workers=0
+    )
+    try:
+        for block_id in block_ids:
+            caching.get_block(block_id)
+        stats = caching.get_cache_stats()
+        assert stats["bytes"] <= 1000 and stats["evictions"] == 3, "Cache content size limit"
+    finally:
+        caching.terminate()
+
+
+def run_tests():
+    test_prefetch_parent()
+    test_byte_limit()
@@ -2,12 +2,23 @@ import _auto_run_with_pytest
 
 from strict_typing import strictly_typed
 from decorate_all import decorate_all_functions
+import asyncio
 import os
+import tempfile
+import time
+from contextlib import contextmanager
+from threading import Thread
+from typing import Generator
+from unittest.mock import patch
 
 import walytis_mutability
 import walytis_beta_api as waly
-from walytis_mutability import MutaBlock, MutaBlockchain
+from walytis_mutability import AsyncMutaBlockchain, MutaBlock, MutaBlockchain
 from walytis_beta_api import Blockchain
+from walytis_mutability.mutablock import ORIGINAL_BLOCK, UPDATE_BLOCK
+from walytis_mutability.mutablockchain import ReservedTopicError
+from brenthy_tools_beta.utils import bytes_to_string
+from walytis_mutability.memory_blockchain import MemoryBlockchain
 
 
 m_blockchain: MutaBlockchain
@@ -19,6 +30,43 @@ def _on_block_received(block):
     pass
 
 
+@contextmanager
+def _open_mutablockchain(**kwargs) -> Generator[MutaBlockchain, None, None]:
+    """Load an additional MutaBlockchain on the test blockchain.
+
+    Terminating a MutaBlockchain terminates its base blockchain, so it gets
+    its own Blockchain object instead of sharing `base_blockchain`, and its
+    own database in a temporary directory unless `appdata_dir` is given.
+    """
+    with tempfile.TemporaryDirectory() as appdata_dir:
+        kwargs.setdefault("appdata_dir", appdata_dir)
+        mutablockchain = MutaBlockchain(
+            base_blockchain=Blockchain(base_blockchain.blockchain_id),
+            **kwargs
+        )
+        try:
+            yield mutablockchain
+        finally:
+            mutablockchain.terminate()
+
+
+@contextmanager
+def _record_ingested_blocks() -> Generator[list[bytes], None, None]:
+    """Record the IDs of the base blocks passed to `ingest_blocks`."""
+    ingested = []
+    ingest_blocks = MutaBlockchain.ingest_blocks
+
+    def record(self, blocks, notify=True):
+        ingested.extend(
+            bytes(block) if isinstance(block, (bytes, bytearray))
+            else bytes(block.long_id)
+            for block in blocks
+        )
+        return ingest_blocks(self, blocks, notify)
+    with patch.object(MutaBlockchain, "ingest_blocks", record):
+        yield ingested
+
+
 def test_prepare():
     if "MutablocksTest" in waly.list_blockchain_names():
         print("Deleting walytis_mutability...")
@@ -58,9 +106,380 @@ def test_update_mutablock():
     assert  m_blockchain.get_block(block.long_id).get_current_content_version().content == block.get_current_content_version().content == updated_content, "Mutablock update"
 
 
+def test_find_blocks():
+    print("Querying mutablocks by topic...")
+    tagged = m_blockchain.add_block("Tagged".encode(), "TopicA")
+    assert tagged.long_id in [found.long_id for found in m_blockchain.find_blocks(topic="TopicA")], "Find by topic"
+    tagged.edit("Retagged".encode(), "TopicB")
+    assert tagged.long_id not in [found.long_id for found in m_blockchain.find_blocks(topic="TopicA")], "Topic removed on update"
+    assert tagged.long_id in [found.long_id for found in m_blockchain.find_blocks(topic="TopicB", creator_id=tagged.creator_id)], "Find by topic and creator"
+
+
+def test_versions_between():
+    print("Querying content versions by time...")
+    start = block.get_current_content_version().timestamp
+    versions = m_blockchain.get_versions_between(start)
+    assert versions and versions[0].cv_id == block.get_current_content_version().cv_id, "Versions since timestamp"
+    assert block.long_id in [modified.long_id for modified in m_blockchain.get_modified_blocks_since(start)], "Modified blocks since timestamp"
+    assert [version.cv_id for version in block.get_versions_between(end=start)] == block.get_content_version_ids()[:-1], "MutaBlock versions before timestamp"
+
+
+def test_content_at():
+    print("Reading mutablock state at a point in time...")
+    first_version, latest_version = block.get_content_versions()[0], block.get_current_content_version()
+    assert block.content_at(first_version.timestamp) == first_version.content, "Content at first version"
+    assert block.content_at(latest_version.timestamp) == latest_version.content, "Content at latest version"
+    assert m_blockchain.snapshot_at(first_version.timestamp)[bytes(block.long_id)].cv_id == first_version.cv_id, "Snapshot at timestamp"
+
+
+def test_reload_mutablockchain():
+    print("Reloading MutaBlockchain...")
+    with _open_mutablockchain() as reloaded:
+        assert block.long_id in reloaded.get_mutablock_ids(), "Reload MutaBlock IDs"
+        assert reloaded.get_mutablock_content_version_ids(block.long_id) == m_blockchain.get_mutablock_content_version_ids(block.long_id), "Reload content versions"
+        assert reloaded.get_orphan_stats()["pending"] == 0, "No orphaned blocks"
+
+
+def test_resume_from_checkpoint():
+    print("Resuming MutaBlockchain from its checkpoint...")
+    with tempfile.TemporaryDirectory() as appdata_dir:
+        with _open_mutablockchain(appdata_dir=appdata_dir):
+            pass
+        late_block = m_blockchain.add_block("After checkpoint".encode())
+        with _record_ingested_blocks() as ingested, _open_mutablockchain(appdata_dir=appdata_dir) as resumed:
+            assert ingested == [bytes(late_block.long_id)], "Only blocks after checkpoint processed"
+            assert resumed.get_block(late_block.long_id).content == late_block.content, "Resumed MutaBlock content"
+
+
+def test_snapshot():
+    print("Bootstrapping MutaBlockchain from a snapshot...")
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        snapshot_path = os.path.join(snapshot_dir, "snapshot")
+        with _open_mutablockchain() as exporting:
+            exporting.export_snapshot(snapshot_path)
+        late_block = m_blockchain.add_block("After snapshot".encode())
+        with _record_ingested_blocks() as ingested, _open_mutablockchain(snapshot_path=snapshot_path) as bootstrapped:
+            assert ingested == [bytes(late_block.long_id)], "Only blocks after snapshot processed"
+            assert bootstrapped.get_mutablock_content_version_ids(block.long_id) == m_blockchain.get_mutablock_content_version_ids(block.long_id), "Snapshot content versions"
+            assert bootstrapped.get_block(block.long_id).content == block.content, "Snapshot head content"
+            assert bootstrapped.get_block(late_block.long_id).content == late_block.content, "Content added after snapshot"
+
+
+def test_orphan_blocks():
+    print("Processing blocks received before their parents...")
+    memory_blockchain = MemoryBlockchain()
+    receiving = MutaBlockchain(memory_blockchain)
+    bootstrapped = None
+    try:
+        original = receiving.add_block("Version 0".encode())
+        parent = memory_blockchain.create_block("Version 1".encode(), [UPDATE_BLOCK, bytes_to_string(original.long_id)])
+        child = memory_blockchain.create_block("Version 2".encode(), [UPDATE_BLOCK, bytes_to_string(parent.long_id)])
+        memory_blockchain.receive_block(child)
+        assert receiving.get_orphan_stats()["pending"] == 1, "Orphan parked"
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot_path = os.path.join(snapshot_dir, "snapshot")
+            receiving.export_snapshot(snapshot_path)
+            time.sleep(0.01)
+            memory_blockchain.receive_block(parent)
+            stats = receiving.get_orphan_stats()
+            assert stats["pending"] == 0 and stats["resolved"] == 1 and stats["max_wait_s"] > 0, "Orphan resolved"
+            assert original.content == "Version 2".encode(), "Orphan processed"
+            # the snapshot's checkpoint excludes the orphan, so it's retried
+            bootstrapped = MutaBlockchain(memory_blockchain, snapshot_path=snapshot_path)
+            assert bootstrapped.get_mutablock_content_version_ids(original.long_id) == receiving.get_mutablock_content_version_ids(original.long_id), "Orphan processed after bootstrapping from snapshot"
+    finally:
+        receiving.terminate()
+        if bootstrapped:
+            bootstrapped.terminate()
+
+
+def test_dropped_orphan_blocks():
+    print("Dropping blocks with corrupt or missing ancestry...")
+    memory_blockchain = MemoryBlockchain()
+    with tempfile.TemporaryDirectory() as appdata_dir:
+        receiving = MutaBlockchain(memory_blockchain, appdata_dir=appdata_dir, max_orphans=1)
+        try:
+            original = receiving.add_block("Version 0".encode())
+            not_mutablock = memory_blockchain.add_block("Not a MutaBlock".encode())
+            corrupt = memory_blockchain.add_block("Corrupt".encode(), [UPDATE_BLOCK, bytes_to_string(not_mutablock.long_id)])
+            assert not receiving.is_content_version_known(corrupt.long_id), "Block with corrupt ancestry skipped"
+            parent = memory_blockchain.create_block("Version 1".encode(), [UPDATE_BLOCK, bytes_to_string(original.long_id)])
+            child = memory_blockchain.create_block("Version 2".encode(), [UPDATE_BLOCK, bytes_to_string(parent.long_id)])
+            memory_blockchain.receive_block(child)
+            memory_blockchain.receive_block(memory_blockchain.create_block("Orphan".encode(), [UPDATE_BLOCK, bytes_to_string(os.urandom(28))]))
+            assert receiving.get_orphan_stats()["evicted"] == 1, "Orphan evicted"
+            memory_blockchain.receive_block(parent)
+            assert original.content == "Version 1".encode(), "Evicted orphan not processed"
+        finally:
+            receiving.terminate()
+        # the checkpoint excludes the evicted orphan, so it's retried
+        reloaded = MutaBlockchain(memory_blockchain, appdata_dir=appdata_dir)
+        try:
+            assert reloaded.get_block(original.long_id).content == "Version 2".encode(), "Evicted orphan processed after restart"
+        finally:
+            reloaded.terminate()
+
+
+def test_shared_database():
+    print("Loading MutaBlockchains sharing a database...")
+    with tempfile.TemporaryDirectory() as appdata_dir:
+        with _open_mutablockchain(appdata_dir=appdata_dir) as first, _open_mutablockchain(appdata_dir=appdata_dir) as second:
+            shared_block = first.add_block("Shared".encode())
+            # stored in the database by `first` before `second` processes it
+            second.ingest_blocks([first.base_blockchain.get_block(shared_block.long_id)])
+            assert second.get_mutablock_content_version_ids(shared_block.long_id) == [bytes(shared_block.long_id)], "Index versions stored by another instance"
+
+
+def test_ingest_blocks():
+    print("Ingesting base blocks in bulk...")
+    with _open_mutablockchain(auto_load_missed_blocks=False) as ingesting:
+        assert ingesting.ingest_blocks(ingesting.base_blockchain.get_block_ids(), notify=False) > 0, "Bulk ingestion"
+        assert ingesting.get_mutablock_content_version_ids(block.long_id) == m_blockchain.get_mutablock_content_version_ids(block.long_id), "Bulk ingested content versions"
+
+
+def test_batch_operations():
+    print("Creating mutablocks in a batch...")
+    contents = [f"Batch {i}".encode() for i in range(5)]
+    blocks = m_blockchain.add_blocks(contents)
+    assert [block.content for block in blocks] == contents, "Batch creation"
+    updated_contents = [content + b" updated" for content in contents]
+    m_blockchain.edit_blocks({
+        bytes(block.long_id): content
+        for block, content in zip(blocks, updated_contents)
+    })
+    assert [block.content for block in blocks] == updated_contents, "Batch update"
+    m_blockchain.delete_blocks([
+        m_blockchain.get_mutablock_head_id(block.long_id) for block in blocks
+    ])
+    assert all(
+        block.get_current_content_version().type == "MutaBlock-Deletion"
+        for block in blocks
+    ), "Batch deletion"
+
+
+def test_concurrent_batch():
+    print("Receiving blocks during a batch on another thread...")
+    memory_blockchain = MemoryBlockchain()
+    notifications = []
+    batching = MutaBlockchain(memory_blockchain, block_received_handler=notifications.append, max_write_workers=1)
+    peer_block = memory_blockchain.create_block("Peer".encode(), ORIGINAL_BLOCK)
+    add_block = memory_blockchain.add_block
+    notified_during_batch = []
+
+    def add_block_receiving_peer_block(*args):
+        if not notified_during_batch:
+            thread = Thread(target=memory_blockchain.receive_block, args=(peer_block,))
+            thread.start()
+            thread.join()
+            notified_during_batch.append([bytes(notification.long_id) for notification in notifications])
+        return add_block(*args)
+    try:
+        with patch.object(memory_blockchain, "add_block", add_block_receiving_peer_block):
+            batching.add_blocks(["Batch 0".encode(), "Batch 1".encode()])
+        assert notified_during_batch == [[bytes(peer_block.long_id)]], "Peer block not deferred by other thread's batch"
+        assert len(notifications) == 3, "Batch notifications"
+    finally:
+        batching.terminate()
+
+
+def test_head_access():
+    print("Accessing MutaBlock heads without the base blockchain...")
+    memory_blockchain = MemoryBlockchain()
+    heads = MutaBlockchain(memory_blockchain, cache_max_entries=2)
+    try:
+        head_blocks = [heads.add_block(f"Version {i}".encode()) for i in range(5)]
+        for head_block in head_blocks:
+            head_block.edit("Edited".encode())
+            head_block.content
+        known_block = memory_blockchain.get_block(heads.get_mutablock_head_id(head_blocks[0].long_id))
+        update = memory_blockchain.create_block("Received".encode(), [UPDATE_BLOCK, bytes_to_string(known_block.long_id)])
+        with patch.object(memory_blockchain, "get_block", wraps=memory_blockchain.get_block) as get_block:
+            assert [head_block.content for head_block in head_blocks] == ["Edited".encode()] * 5, "Head content"
+            # already processed blocks are recognised without decoding them
+            memory_blockchain.receive_block(known_block)
+            # the update's ancestry is verified from memory
+            memory_blockchain.receive_block(update)
+            assert get_block.call_count == 0, "Heads and ancestry served without the base blockchain"
+        assert len(heads.get_mutablock_content_version_ids(head_blocks[0].long_id)) == 3, "Received update, no duplicate"
+        assert head_blocks[0].content == "Received".encode(), "Received head content"
+    finally:
+        heads.terminate()
+
+
+def test_content_version_cache():
+    print("Limiting the size of cached ContentVersions...")
+    with _open_mutablockchain(cache_max_bytes=1000) as bounded:
+        contents = [os.urandom(100000) for _ in range(5)]
+        bounded_blocks = [bounded.add_block(content) for content in contents]
+        assert [bounded_block.content for bounded_block in bounded_blocks] == contents, "Bounded cache content"
+        stats = bounded.get_cache_stats()
+        assert stats["evictions"] > 0 and stats["bytes"] <= len(contents[0]), "Loaded content counts towards cache size"
+        head_id = bounded.get_mutablock_head_id(bounded_blocks[0].long_id)
+        assert bounded.get_content_version(head_id) == bounded.decode_base_block(bounded.base_blockchain.get_block(head_id)), "ContentVersion equality"
+
+
+def test_caching_blockchain():
+    print("Loading MutaBlockchain with cached base blocks...")
+    with _open_mutablockchain(cache_base_blocks=True) as cached:
+        assert cached.get_block(block.long_id).content == block.content, "Cached MutaBlock content"
+        head_id = cached.get_mutablock_head_id(block.long_id)
+        cached.base_blockchain.get_block(head_id)
+        cached.base_blockchain.get_block(head_id)
+        assert cached.base_blockchain.get_cache_stats()["hits"] > 0, "Base block caching"
+
+
+def test_delta_updates():
+    print("Editing mutablock with delta updates...")
+    with _open_mutablockchain(delta_updates=True) as delta_blockchain:
+        content = bytes(range(256)) * 16
+        delta_block = delta_blockchain.add_block(content)
+        updated_content = content[:100] + b"Edited" + content[106:]
+        delta_block.edit(updated_content)
+        head = delta_block.get_current_content_version()
+        assert len(delta_blockchain.base_blockchain.get_block(head.cv_id).content) < len(updated_content), "Delta update size"
+        assert head.type == "MutaBlock-Update" and delta_block.content == updated_content, "Delta update content"
+
+
+def test_compression():
+    print("Creating compressed mutablock...")
+    with _open_mutablockchain(codec="zlib") as compressing_blockchain:
+        content = b'{"key": "value"}' * 256
+        compressed_block = compressing_blockchain.add_block(content, "Compressed")
+        assert len(compressing_blockchain.base_blockchain.get_block(compressed_block.long_id).content) < len(content), "Compressed content size"
+        assert compressed_block.content == content and compressed_block.topics == ["Compressed"], "Compressed content"
+
+
+def test_reserved_topics():
+    print("Rejecting reserved user topics...")
+    memory_blockchain = MemoryBlockchain()
+    reserving = MutaBlockchain(memory_blockchain)
+    try:
+        block = reserving.add_block("Content".encode(), "Topic")
+        for write in [
+            lambda: reserving.add_block("Content".encode(), "MutaBlock-Chunked"),
+            lambda: reserving.edit_block(block.long_id, "Edited".encode(), ["Topic", "MutaBlock-Codec:zlib"]),
+            lambda: reserving.add_blocks([("Content".encode(), ["MutaBlock-Codec:none"])]),
+        ]:
+            try:
+                write()
+                assert False, "Reserved topic rejected"
+            except ReservedTopicError:
+                pass
+        assert len(memory_blockchain.get_block_ids()) == 1, "No blocks with reserved topics created"
+        assert block.content == "Content".encode() and block.topics == ["Topic"], "MutaBlock unchanged"
+    finally:
+        reserving.terminate()
+
+
+def test_received_block_notifications():
+    print("Passing decoded received blocks to the handler...")
+    memory_blockchain = MemoryBlockchain()
+    notifications = []
+    receiving = MutaBlockchain(memory_blockchain, block_received_handler=notifications.append, delta_updates=True, codec="zlib")
+    try:
+        content = bytes(range(256)) * 16
+        updated_content = content[:100] + "Edited".encode() + content[106:]
+        received_block = receiving.add_block(content, "Topic")
+        received_block.edit(updated_content)
+        assert [notification.content for notification in notifications] == [content, updated_content], "Decoded content passed to handler"
+        assert [notification.topics for notification in notifications] == [[ORIGINAL_BLOCK, "Topic"], [UPDATE_BLOCK, bytes_to_string(received_block.long_id)]], "Encoding topics hidden from handler"
+    finally:
+        receiving.terminate()
+
+
+def test_chunked_content():
+    print("Creating chunked mutablock...")
+    with _open_mutablockchain(chunk_size=1024) as chunking_blockchain:
+        content = os.urandom(4000)
+        chunked_block = chunking_blockchain.add_block(content)
+        assert len(chunking_blockchain.base_blockchain.get_block(chunked_block.long_id).content) < 1024, "Chunk manifest size"
+        assert chunked_block.content == content, "Chunked content"
+        reader = chunked_block.open()
+        reader.seek(1000)
+        assert reader.read(100) == content[1000:1100], "Streamed chunked content"
+
+
+def test_receive_pipeline():
+    print("Processing received blocks on worker threads...")
+    pipelined_block = m_blockchain.add_block("Version 0".encode())
+    pipelined_block.edit("Version 1".encode())
+    pipelined_block.edit("Version 2".encode())
+    version_ids = pipelined_block.get_content_version_ids()
+    notifications = []
+    with _open_mutablockchain(block_received_handler=notifications.append, auto_load_missed_blocks=False, receive_workers=4, sequential_block_handling=False) as pipelined:
+        # receive the versions in quick succession, as from a peer
+        for version_id in version_ids:
+            pipelined.base_blockchain.block_received_handler(pipelined.base_blockchain.get_block(version_id))
+        pipelined.flush()
+        assert pipelined.get_block(pipelined_block.long_id).content == "Version 2".encode(), "Pipelined block processing"
+        assert [bytes(notification.long_id) for notification in notifications if bytes(notification.long_id) in version_ids] == version_ids, "Pipelined MutaBlock versions handled in order"
+
+
+def test_coalesced_notifications():
+    print("Coalescing block notifications...")
+    notifications = []
+    with _open_mutablockchain(block_received_handler=notifications.append, coalesce_window=60, delta_updates=True) as coalescing:
+        content = bytes(range(256)) * 16
+        coalesced_block = coalescing.add_block(content)
+        coalesced_block.edit(content[:100] + b"Version 1" + content[109:])
+        coalesced_block.edit(content[:100] + b"Version 2" + content[109:])
+        coalescing.flush()
+        assert len(notifications) == 1 and len(notifications[0].intermediate_version_ids) == 2, "Coalesced notification"
+        assert notifications[0].content == content[:100] + b"Version 2" + content[109:], "Coalesced notification head content"
+
+
+def test_coalesced_late_version():
+    print("Coalescing notifications of versions received out of order...")
+    memory_blockchain = MemoryBlockchain()
+    notifications = []
+    coalescing = MutaBlockchain(memory_blockchain, block_received_handler=notifications.append, coalesce_window=60)
+    try:
+        original = coalescing.add_block("Version 0".encode())
+        old_fork = memory_blockchain.create_block("Old fork".encode(), [UPDATE_BLOCK, bytes_to_string(original.long_id)])
+        new = memory_blockchain.create_block("New".encode(), [UPDATE_BLOCK, bytes_to_string(original.long_id)])
+        memory_blockchain.receive_block(new)
+        coalescing.flush()
+        assert len(notifications) == 1 and notifications[0].content == "New".encode(), "Coalesced notification of head"
+        memory_blockchain.receive_block(old_fork)
+        coalescing.flush()
+        assert len(notifications) == 1, "No notification for late version that isn't the head"
+        assert original.content == "New".encode(), "Head after late version"
+    finally:
+        coalescing.terminate()
+
+
+def test_async_mutablockchain():
+    async def run():
+        async with AsyncMutaBlockchain(m_blockchain) as async_blockchain:
+            contents = [f"Async {i}".encode() for i in range(3)]
+            blocks = await asyncio.gather(*[
+                async_blockchain.add_block(content) for content in contents
+            ])
+            return [
+                await async_blockchain.get_content(block.long_id)
+                for block in blocks
+            ], contents
+    results, contents = asyncio.run(run())
+    assert results == contents, "Async MutaBlock creation"
+
+    content = b'{"key": "value"}' * 256
+
+    async def run_with_codec():
+        async with AsyncMutaBlockchain(m_blockchain) as async_blockchain:
+            compressed_block = await async_blockchain.add_block(content, "Async", codec="zlib")
+            await async_blockchain.edit_block(compressed_block.long_id, content + b"!", ["Edited"], codec="zlib")
+            return compressed_block
+    compressed_block = asyncio.run(run_with_codec())
+    head_id = m_blockchain.get_mutablock_head_id(compressed_block.long_id)
+    assert len(m_blockchain.base_blockchain.get_block(head_id).content) < len(content), "Async edit with codec"
+    assert compressed_block.content == content + b"!" and compressed_block.topics == ["Edited"], "Async edit with topics"
+
+
 def test_delete_mutablock():
     print("Deleting mutablock...")
     block.delete()
+    assert bytes(block.long_id) not in m_blockchain.get_live_block_ids(), "Deleted mutablock not live"
+    assert m_blockchain.get_num_live_blocks() == len(m_blockchain.get_live_block_ids()), "Number of live mutablocks"
     # assert m_blockchain.get_mutablock_ids() == []
 
 
@@ -81,6 +500,30 @@ def run_tests():
     test_create_mutablockchain()
     test_create_mutablock()
     test_update_mutablock()
+    test_find_blocks()
+    test_versions_between()
+    test_content_at()
+    test_reload_mutablockchain()
+    test_resume_from_checkpoint()
+    test_snapshot()
+    test_orphan_blocks()
+    test_dropped_orphan_blocks()
+    test_shared_database()
+    test_ingest_blocks()
+    test_batch_operations()
+    test_concurrent_batch()
+    test_head_access()
+    test_content_version_cache()
+    test_caching_blockchain()
+    test_delta_updates()
+    test_compression()
+    test_reserved_topics()
+    test_received_block_notifications()
+    test_chunked_content()
+    test_receive_pipeline()
+    test_coalesced_notifications()
+    test_coalesced_late_version()
+    test_async_mutablockchain()
     test_delete_mutablock()
     test_delete_mutablockchain()
     test_cleanup()
@@ -0,0 +1,43 @@
+import _auto_run_with_pytest
+
+import os
+import sys
+import types
+from unittest.mock import patch
+
+from walytis_mutability import utils
+
+
+def test_production_mode_env_var():
+    for value, production_mode in [
+        ("true", True), ("1", True), ("false", False), ("", False)
+    ]:
+        with patch.dict(os.environ, {"WALYTIS_MUTABILITY_PRODUCTION": value}):
+            assert utils._read_production_mode() == production_mode, f"Production mode for {value!r}"
+
+
+def test_apply_strict_typing():
+    for production_mode in [False, True]:
+        module = types.ModuleType("strictly_typed_module")
+
+        def function():
+            pass
+        module.function = function
+        checked = []
+
+        def strictly_typed(function):
+            checked.append(function)
+            return function
+        sys.modules[module.__name__] = module
+        try:
+            with patch.object(utils, "PRODUCTION_MODE", production_mode), patch.object(utils, "strictly_typed", strictly_typed):
+                utils.apply_strict_typing(module.__name__)
+        finally:
+            del sys.modules[module.__name__]
+        expected = [] if production_mode else [function]
+        assert checked == expected, f"Type checking with production mode {production_mode}"
+
+
+def run_tests():
+    test_production_mode_env_var()
+    test_apply_strict_typing()